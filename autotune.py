@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本机自动调优
+用合成图像做短时间的标定：依次扫描 torch 算子内线程数、算子间线程数和工作进程数，
+把吞吐最高的组合写入本机调优文件，ConfigManager 启动时自动加载
+"""
+
+import json
+import multiprocessing as mp
+import queue
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import click
+import numpy as np
+import torch
+from PIL import Image, ImageDraw
+from loguru import logger
+
+from config import available_cpus, host_fingerprint, host_profile_path
+from model_pool import MB, current_rss
+
+PROFILE_VERSION = 2
+# 单个子进程加载模型和完成标定的最长等待时间（秒）
+TRIAL_TIMEOUT_S = 1800
+
+
+def synthetic_samples(count: int, size: int, seed: int = 0) -> List[Tuple[Image.Image, np.ndarray]]:
+    """生成带半透明文字水印的合成图像及对应掩膜（固定随机种子，保证各轮标定负载一致）"""
+    rng = np.random.default_rng(seed)
+    samples = []
+    for _ in range(count):
+        gradient = np.linspace(0, 255, size, dtype=np.float32)
+        background = (gradient[None, :, None] * rng.uniform(0.3, 1.0, 3) + rng.normal(0, 12, (size, size, 3)))
+        image = Image.fromarray(np.clip(background, 0, 255).astype(np.uint8)).convert("RGBA")
+
+        overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(overlay)
+        x, y = int(rng.integers(0, size // 2)), int(rng.integers(0, size - size // 8))
+        box = (x, y, x + size // 2, y + size // 10)
+        draw.text((x + 4, y + 4), "SAMPLE WATERMARK", fill=(255, 255, 255, 160))
+        image = Image.alpha_composite(image, overlay).convert("RGB")
+
+        mask = np.zeros((size, size), dtype=np.uint8)
+        mask[box[1]:box[3], box[0]:box[2]] = 255
+        samples.append((image, mask))
+    return samples
+
+
+def _calibrate(device: str, inter_threads: int, intra_values: Sequence[int], count: int, size: int,
+               start, results):
+    """子进程：设置线程数、加载模型，等待父进程同步后对每个算子内线程数计时"""
+    from watermark_remover import WatermarkRemover
+
+    torch.set_num_interop_threads(inter_threads)
+    remover = WatermarkRemover(device=device)
+    samples = synthetic_samples(count + 1, size)
+    results.put(("loaded", current_rss()))
+    start.wait()
+
+    for intra in intra_values:
+        torch.set_num_threads(intra)
+        timings = []
+        for image, mask in samples:
+            begin = time.perf_counter()
+            remover.detect(image)
+            remover.inpaint(np.asarray(image), mask)
+            timings.append(time.perf_counter() - begin)
+        # The first sample only warms up kernels for this thread count
+        results.put(("timing", intra, sum(timings[1:]) / count))
+    remover.close()
+
+
+def _available_memory() -> Optional[int]:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def run_trial(device: str, inter_threads: int, intra_values: Sequence[int], workers: int = 1, count: int = 2,
+              size: int = 512) -> Tuple[Dict[int, List[float]], int]:
+    """
+    启动 workers 个子进程并发标定
+
+    返回 ({算子内线程数: 各进程的每图秒数}, 单进程加载模型后的最大 RSS)。
+    算子间线程数只能在进程首次并行计算前设置，因此每轮都使用新进程。
+    """
+    ctx = mp.get_context("spawn")
+    results, start = ctx.Queue(), ctx.Event()
+    processes = [ctx.Process(target=_calibrate, args=(device, inter_threads, list(intra_values), count, size,
+                                                      start, results), daemon=True)
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+
+    def collect(expected: int) -> List[tuple]:
+        messages = []
+        deadline = time.monotonic() + TRIAL_TIMEOUT_S
+        while len(messages) < expected:
+            try:
+                messages.append(results.get(timeout=1))
+            except queue.Empty:
+                failed = [p.exitcode for p in processes if p.exitcode not in (None, 0)]
+                if failed or time.monotonic() > deadline:
+                    for process in processes:
+                        process.kill()
+                    raise RuntimeError(f"Calibration worker failed (exit codes {failed})")
+        return messages
+
+    try:
+        loaded_rss = max(rss for _, rss in collect(workers))
+        start.set()
+        timings: Dict[int, List[float]] = {intra: [] for intra in intra_values}
+        for _, intra, seconds in collect(workers * len(intra_values)):
+            timings[intra].append(seconds)
+    finally:
+        for process in processes:
+            process.join(timeout=30)
+    return timings, loaded_rss
+
+
+def _thread_candidates(cpus: int) -> List[int]:
+    candidates = {cpus}
+    value = 1
+    while value < cpus:
+        candidates.add(value)
+        value *= 2
+    return sorted(candidates)
+
+
+def tune(device: str, count: int = 2, size: int = 512, max_workers: Optional[int] = None) -> Dict:
+    """
+    分三步搜索（每步固定前一步的最优值）：
+    1. 单进程扫描算子内线程数
+    2. 扫描算子间线程数
+    3. 扫描工作进程数，CPU 在进程间平分，受可用内存限制
+
+    单进程最优的线程数（num_threads）与多进程时每个进程的线程数（worker_threads）分开保存，
+    未指定 --workers 的默认单进程运行不会沿用多进程的划分
+    """
+    cpus = available_cpus()
+    measurements = []
+
+    def record(inter: int, intra: int, workers: int, seconds: List[float]) -> float:
+        throughput = sum(1 / s for s in seconds)
+        measurements.append({"num_threads": intra, "num_interop_threads": inter, "workers": workers,
+                             "seconds_per_image": round(max(seconds), 3), "images_per_second": round(throughput, 3)})
+        logger.info(f"intra={intra} inter={inter} workers={workers}: {throughput:.3f} images/s")
+        return throughput
+
+    timings, worker_rss = run_trial(device, 1, _thread_candidates(cpus), count=count, size=size)
+    scores = {intra: record(1, intra, 1, seconds) for intra, seconds in timings.items()}
+    best_intra = max(scores, key=scores.get)
+    best = {"num_threads": best_intra, "num_interop_threads": 1, "workers": 1, "worker_threads": best_intra}
+    best_throughput = scores[best_intra]
+
+    for inter in (2, 4):
+        if inter > cpus:
+            break
+        timings, _ = run_trial(device, inter, [best_intra], count=count, size=size)
+        throughput = record(inter, best_intra, 1, timings[best_intra])
+        if throughput > best_throughput:
+            best_throughput = throughput
+            best["num_interop_threads"] = inter
+
+    available = _available_memory()
+    max_workers = max_workers or cpus
+    for workers in range(2, max_workers + 1):
+        if available is not None and workers * worker_rss > available:
+            logger.info(f"Stopping worker sweep at {workers}: {workers} x {worker_rss / MB:.0f} MB exceeds "
+                        f"{available / MB:.0f} MB available")
+            break
+        intra = max(1, cpus // workers)
+        timings, _ = run_trial(device, best["num_interop_threads"], [intra], workers=workers, count=count, size=size)
+        throughput = record(best["num_interop_threads"], intra, workers, timings[intra])
+        if throughput <= best_throughput:
+            break
+        best_throughput = throughput
+        best.update(workers=workers, worker_threads=intra)
+
+    return {
+        "version": PROFILE_VERSION,
+        "fingerprint": host_fingerprint(device),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "settings": best,
+        "images_per_second": round(best_throughput, 3),
+        "calibration": {"images": count, "size": size, "worker_rss_mb": round(worker_rss / MB, 1)},
+        "measurements": measurements,
+    }
+
+
+@click.command()
+@click.option("--output", type=click.Path(dir_okay=False), default=None,
+              help="Profile file to write (default: $WATERMARK_HOST_PROFILE or ~/.cache/watermark-remove).")
+@click.option("--images", default=2, help="Timed synthetic images per calibration pass.")
+@click.option("--size", default=512, help="Side length of the synthetic images.")
+@click.option("--max-workers", type=int, default=None, help="Upper bound for the worker-count sweep.")
+def main(output: str, images: int, size: int, max_workers: int):
+    """Measure the fastest thread and worker settings on this host and save them for ConfigManager."""
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    logger.info(f"Tuning on {device} with {available_cpus()} CPUs")
+    profile = tune(device, count=images, size=size, max_workers=max_workers)
+
+    path = Path(output) if output else host_profile_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(profile, indent=2))
+    logger.info(f"Best settings {profile['settings']} ({profile['images_per_second']} images/s), saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
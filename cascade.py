@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+检测器级联
+先用较小的 Florence-2-base 检测水印，仅在结果不确定时升级到 Florence-2-large
+"""
+
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw
+from loguru import logger
+
+from config import CascadeConfig, ModelConfig
+from image_buffer import bboxes_to_mask_array
+from profiling import stage
+
+DETECTION_KEY = "<OPEN_VOCABULARY_DETECTION>"
+
+BBox = Tuple[int, int, int, int]
+
+
+@dataclass
+class DetectorTier:
+    """级联中的一级检测器"""
+    name: str
+    model_name: str
+
+
+@dataclass
+class DetectionResult:
+    """单张图像的检测结果（mask 为单通道 uint8 数组）"""
+    mask: np.ndarray
+    tier: str
+    accepted_bboxes: List[BBox] = field(default_factory=list)
+    rejected_bboxes: List[BBox] = field(default_factory=list)
+    heuristic_score: Optional[float] = None
+    escalation_reason: Optional[str] = None
+
+
+def split_bboxes(parsed_answer: Dict, image_size: Tuple[int, int],
+                 max_bbox_percent: float) -> Tuple[List[BBox], List[BBox]]:
+    """按 max_bbox_percent 将检测框分为接受和拒绝两组"""
+    accepted, rejected = [], []
+    if DETECTION_KEY not in parsed_answer or "bboxes" not in parsed_answer[DETECTION_KEY]:
+        return accepted, rejected
+
+    image_area = image_size[0] * image_size[1]
+    for bbox in parsed_answer[DETECTION_KEY]["bboxes"]:
+        x1, y1, x2, y2 = map(int, bbox)
+        bbox_area = (x2 - x1) * (y2 - y1)
+        if (bbox_area / image_area) * 100 <= max_bbox_percent:
+            accepted.append((x1, y1, x2, y2))
+        else:
+            logger.warning(
+                f"Skipping large bounding box: {bbox} covering {bbox_area / image_area:.2%} of the image")
+            rejected.append((x1, y1, x2, y2))
+    return accepted, rejected
+
+
+def bboxes_to_mask(image_size: Tuple[int, int], bboxes: Sequence[BBox]) -> Image.Image:
+    """将检测框绘制为 L 模式掩膜"""
+    mask = Image.new("L", image_size, 0)
+    draw = ImageDraw.Draw(mask)
+    for bbox in bboxes:
+        draw.rectangle(list(bbox), fill=255)
+    return mask
+
+
+def watermark_heuristic_score(image: Image.Image, max_side: int = 512) -> float:
+    """
+    廉价的水印可能性启发式评分（0~1）
+
+    在缩小后的灰度图上做形态学梯度 + 水平闭运算，统计类似文字行的连通域数量。
+    文字/Logo 类水印通常会产生若干扁长、高度较小的连通域。
+    """
+    gray = np.asarray(image.convert("L"))
+    scale = max_side / max(gray.shape)
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    height, width = gray.shape
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, np.ones((3, 3), np.uint8))
+    _, binary = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (9, 1)))
+
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    text_like = 0
+    for contour in contours:
+        _, _, w, h = cv2.boundingRect(contour)
+        if w >= 2 * h and 0.01 * height <= h <= 0.15 * height and w <= 0.8 * width:
+            text_like += 1
+
+    return min(1.0, text_like / 3.0)
+
+
+class DetectorCascade:
+    """
+    置信度级联检测器
+
+    按顺序运行各级检测器，出现以下任一不确定情况时升级到下一级：
+    - 启发式认为可能有水印，但当前级别没有接受任何检测框
+    - 有检测框因超过 max_bbox_percent 被拒绝
+    - 当前级别检测到水印，但启发式评分极低（二者存在分歧）
+    """
+
+    def __init__(self, tiers: Sequence[DetectorTier], loader: Callable, identify_fn: Callable,
+                 device: str, cascade_config: CascadeConfig, pin: Optional[Callable] = None):
+        if not tiers:
+            raise ValueError("DetectorCascade requires at least one tier")
+        self.tiers = list(tiers)
+        self.loader = loader
+        self.identify_fn = identify_fn
+        self.device = device
+        self.config = cascade_config
+        # pin(model_name) 返回上下文管理器，推理期间保持该模型加载（模型池的 pin）
+        self.pin = pin or (lambda _name: nullcontext())
+
+    def warmup(self):
+        """预加载第一级模型，后续级别在需要升级时再加载"""
+        first = self.tiers[0]
+        self.loader(first.model_name, self.device)
+
+    def _uncertainty(self, accepted: List[BBox], rejected: List[BBox], score: float) -> Optional[str]:
+        if rejected:
+            return "rejected_bboxes"
+        if not accepted and score >= self.config.heuristic_threshold:
+            return "missed_likely_watermark"
+        if accepted and score < self.config.disagreement_threshold:
+            return "heuristic_disagreement"
+        return None
+
+    def detect(self, image: Image.Image, text_input: str, task_prompt, max_bbox_percent: float) -> DetectionResult:
+        # 单级时无需启发式评分
+        score = None
+        if len(self.tiers) > 1:
+            with stage("detect.heuristic"):
+                score = watermark_heuristic_score(image)
+        escalation_reason = None
+        for idx, tier in enumerate(self.tiers):
+            with self.pin(tier.model_name):
+                with stage("model.load"):
+                    model, processor = self.loader(tier.model_name, self.device)
+                parsed_answer = self.identify_fn(task_prompt, image, text_input, model, processor, self.device)
+            accepted, rejected = split_bboxes(parsed_answer, image.size, max_bbox_percent)
+
+            is_last = idx == len(self.tiers) - 1
+            reason = None if is_last else self._uncertainty(accepted, rejected, score)
+            if reason is None:
+                return DetectionResult(
+                    mask=bboxes_to_mask_array(image.size, accepted),
+                    tier=tier.name,
+                    accepted_bboxes=accepted,
+                    rejected_bboxes=rejected,
+                    heuristic_score=score,
+                    escalation_reason=escalation_reason,
+                )
+            logger.info(f"Escalating detection from tier '{tier.name}' ({reason})")
+            escalation_reason = reason
+
+
+def build_detector(cascade_enabled: bool, model_config: ModelConfig, cascade_config: CascadeConfig,
+                   identify_fn: Callable, device: str, loader: Callable,
+                   pin: Optional[Callable] = None) -> DetectorCascade:
+    """
+    构建检测器：级联模式为 base -> large，否则仅 large
+
+    loader(model_name, device) 返回 (model, processor)，通常由模型池提供；
+    pin(model_name) 在推理期间保持模型加载
+    """
+    tiers = [DetectorTier("large", model_config.florence_model_name)]
+    if cascade_enabled:
+        tiers.insert(0, DetectorTier("base", model_config.florence_base_model_name))
+    return DetectorCascade(tiers, loader, identify_fn, device, cascade_config, pin)
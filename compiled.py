@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+编译执行模式
+把修复网络的输入裁剪按宽高分别填充到少量尺寸桶，每个桶只编译一次计算图并缓存，
+避免 torch.compile 对每个新尺寸重新编译；启动时预热常用尺寸桶并统计编译缓存命中率。
+支持 CPU 上的 inductor 后端（需要 C++ 编译器）。
+
+只有 forward(image, mask) 形式的普通 torch 模块才会按桶编译。iopaint 自带的修复模型都不满足：
+LaMa、MI-GAN、manga 是 TorchScript（dynamo 无法编译），MAT、FCF 的 forward 需要额外的潜变量或标签，
+LDM 通过采样器调用。这些模型保持即时执行并在编译统计中报告为未编译，--compile 实际只编译 Florence-2 图像编码器
+"""
+
+import bisect
+import inspect
+import time
+from collections import Counter
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import torch
+import torch.nn.functional as F
+from loguru import logger
+
+from config import CompileConfig
+
+Bucket = Tuple[int, int]
+
+
+class CompileStats:
+    """各模型的编译缓存统计：命中（桶已编译）、未命中（首次遇到该桶，触发编译）和超出最大桶的即时执行"""
+
+    def __init__(self):
+        self.counters: Dict[str, Counter] = {}
+        self.compile_seconds: Dict[str, float] = {}
+        # 未编译的模型及原因
+        self.uncompiled: Dict[str, str] = {}
+
+    def mark_uncompiled(self, model: str, reason: str):
+        self.uncompiled[model] = reason
+        self.counters.pop(model, None)
+        self.compile_seconds.pop(model, None)
+
+    def record(self, model: str, outcome: str, seconds: float = 0.0):
+        self.counters.setdefault(model, Counter())[outcome] += 1
+        if outcome in ("miss", "warmup"):
+            self.compile_seconds[model] = self.compile_seconds.get(model, 0.0) + seconds
+
+    def hit_rate(self, model: str) -> Optional[float]:
+        counter = self.counters.get(model, Counter())
+        calls = counter["hit"] + counter["miss"] + counter["eager"]
+        return counter["hit"] / calls if calls else None
+
+    def summary(self) -> str:
+        parts = []
+        for model, counter in self.counters.items():
+            rate = self.hit_rate(model)
+            rate_text = f"{rate:.1%}" if rate is not None else "n/a"
+            parts.append(f"{model}: hit rate {rate_text} (hits={counter['hit']}, misses={counter['miss']}, "
+                         f"eager={counter['eager']}, warmed={counter['warmup']}, "
+                         f"compile {self.compile_seconds.get(model, 0.0):.1f}s)")
+        parts.extend(f"{model}: not compiled ({reason})" for model, reason in self.uncompiled.items())
+        return "; ".join(parts) or "no compiled calls"
+
+
+# 进程内共享的统计，运行结束时由 CLI 输出
+compile_stats = CompileStats()
+
+
+def _raise_cache_limit(graphs: int):
+    # Every bucket is a distinct static shape; keep dynamo from falling back to eager after the default 8
+    dynamo_config = torch._dynamo.config
+    for name in ("cache_size_limit", "recompile_limit"):
+        if hasattr(dynamo_config, name):
+            setattr(dynamo_config, name, max(getattr(dynamo_config, name), graphs))
+
+
+def accepts_image_mask(module: torch.nn.Module) -> bool:
+    """forward 能否只用 (image, mask) 两个位置参数调用（没有其他必需参数）"""
+    try:
+        signature = inspect.signature(module.forward)
+        signature.bind(None, None)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def bucket_for(buckets: Sequence[int], height: int, width: int) -> Optional[Bucket]:
+    """返回 (高, 宽) 所属的桶：各自向上取到 buckets（升序）中最近的尺寸，超过最大桶时返回 None"""
+    i, j = bisect.bisect_left(buckets, height), bisect.bisect_left(buckets, width)
+    if i == len(buckets) or j == len(buckets):
+        return None
+    return buckets[i], buckets[j]
+
+
+class BucketedInpainter:
+    """
+    按尺寸桶执行的修复网络
+
+    替换 iopaint 模型对象上的 model 属性，调用方式不变：forward(image, mask) -> image，
+    输入为 NCHW 张量。高和宽分别向上取到最近的桶尺寸：图像边缘复制填充，掩膜填 0，输出裁回原尺寸。
+    超过最大桶的输入，以及带额外参数的调用，直接用原模型即时执行。
+    """
+
+    def __init__(self, model: torch.nn.Module, name: str, compile_config: CompileConfig,
+                 stats: CompileStats = compile_stats):
+        self.model = model
+        self.name = name
+        self.buckets = sorted(compile_config.buckets)
+        self.stats = stats
+        self._compiled = torch.compile(model, backend=compile_config.backend, mode=compile_config.mode,
+                                       dynamic=False)
+        self._ready = set()
+        _raise_cache_limit(len(self.buckets) ** 2)
+
+    def bucket_for(self, height: int, width: int) -> Optional[Bucket]:
+        return bucket_for(self.buckets, height, width)
+
+    def _run(self, bucket: Bucket, image: torch.Tensor, mask: torch.Tensor) -> torch.Tensor:
+        height, width = image.shape[-2:]
+        pad = (0, bucket[1] - width, 0, bucket[0] - height)
+        image = F.pad(image, pad, mode="replicate")
+        mask = F.pad(mask, pad, value=0)
+        return self._compiled(image, mask)[..., :height, :width]
+
+    @torch.inference_mode()
+    def warmup(self, buckets):
+        """用全零输入为给定的桶编译计算图"""
+        parameter = next(self.model.parameters(), None)
+        device = parameter.device if parameter is not None else "cpu"
+        for height, width in buckets:
+            bucket = self.bucket_for(height, width)
+            if bucket is None or bucket in self._ready:
+                continue
+            start = time.perf_counter()
+            self._run(bucket, torch.zeros(1, 3, *bucket, device=device), torch.zeros(1, 1, *bucket, device=device))
+            self._ready.add(bucket)
+            seconds = time.perf_counter() - start
+            self.stats.record(self.name, "warmup", seconds)
+            logger.info(f"Warmed {self.name} bucket {bucket[0]}x{bucket[1]} in {seconds:.1f}s")
+
+    def __call__(self, image: torch.Tensor, mask: torch.Tensor, *args, **kwargs) -> torch.Tensor:
+        bucket = self.bucket_for(*image.shape[-2:])
+        if bucket is None or args or kwargs:
+            self.stats.record(self.name, "eager")
+            return self.model(image, mask, *args, **kwargs)
+        start = time.perf_counter()
+        result = self._run(bucket, image, mask)
+        if bucket in self._ready:
+            self.stats.record(self.name, "hit")
+        else:
+            self._ready.add(bucket)
+            self.stats.record(self.name, "miss", time.perf_counter() - start)
+        return result
+
+    # iopaint calls the wrapped network as a module
+    forward = __call__
+
+
+def compile_inpaint_model(model_manager: Any, name: str, compile_config: CompileConfig) -> Any:
+    """给 iopaint ModelManager 中的修复网络套上尺寸桶编译，并预热常用桶"""
+    inpaint_model = getattr(model_manager, "model", None)
+    network = getattr(inpaint_model, "model", None)
+    if not isinstance(network, torch.nn.Module):
+        logger.warning(f"{name} does not expose a torch module, keeping eager execution")
+        compile_stats.mark_uncompiled(name, "no torch module")
+        return model_manager
+    if isinstance(network, torch.jit.ScriptModule):
+        # dynamo cannot trace TorchScript, and padding to buckets only adds work for the JIT executor
+        logger.warning(f"{name} is a TorchScript module, which torch.compile cannot compile; keeping eager execution")
+        compile_stats.mark_uncompiled(name, "TorchScript")
+        return model_manager
+    if not accepts_image_mask(network):
+        logger.warning(f"{name} is not called as forward(image, mask), keeping eager execution")
+        compile_stats.mark_uncompiled(name, "unsupported signature")
+        return model_manager
+    bucketed = BucketedInpainter(network, name, compile_config)
+    inpaint_model.model = bucketed
+    try:
+        bucketed.warmup(compile_config.warmup_buckets)
+    except Exception as e:
+        # The signature fits but the network does not treat its second input as a mask
+        logger.warning(f"Cannot compile {name} ({e}), keeping eager execution")
+        inpaint_model.model = network
+        compile_stats.mark_uncompiled(name, "warmup failed")
+    return model_manager
+
+
+def compile_florence(model: Any, processor: Any, name: str, compile_config: CompileConfig) -> Any:
+    """
+    编译 Florence-2 的图像编码器
+
+    处理器总是把图像缩放到固定尺寸，编码器只有一种输入形状，编译一次即可；
+    文本解码的序列长度逐步变化，保持即时执行。
+    """
+    encode = getattr(model, "_encode_image", None)
+    if encode is None:
+        logger.warning(f"{name} has no _encode_image, keeping eager execution")
+        compile_stats.mark_uncompiled(name, "no _encode_image")
+        return model
+    compiled = torch.compile(encode, backend=compile_config.backend, mode=compile_config.mode, dynamic=False)
+    seen = set()
+
+    def encode_image(pixel_values: torch.Tensor):
+        shape = tuple(pixel_values.shape)
+        start = time.perf_counter()
+        result = compiled(pixel_values)
+        if shape in seen:
+            compile_stats.record(name, "hit")
+        else:
+            seen.add(shape)
+            compile_stats.record(name, "miss", time.perf_counter() - start)
+        return result
+
+    model._encode_image = encode_image
+
+    size = getattr(getattr(processor, "image_processor", None), "size", None) or {}
+    if "height" in size and "width" in size:
+        parameter = next(model.parameters())
+        start = time.perf_counter()
+        with torch.inference_mode():
+            compiled(torch.zeros(1, 3, size["height"], size["width"], device=parameter.device, dtype=parameter.dtype))
+        seen.add((1, 3, size["height"], size["width"]))
+        compile_stats.record(name, "warmup", time.perf_counter() - start)
+    return model
@@ -4,18 +4,26 @@
 水印去除服务配置文件
 """
 
+import json
+import os
+import platform
 import torch
 from dataclasses import dataclass
-from typing import Dict, Any
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+from loguru import logger
 
 @dataclass
 class ModelConfig:
     """模型配置"""
     florence_model_name: str = "microsoft/Florence-2-large"
+    florence_base_model_name: str = "microsoft/Florence-2-base"
     max_bbox_percent: float = 10.0
     torch_dtype: torch.dtype = torch.float32
     device_map: str = None
     num_threads: int = 4
+    # torch 算子间并行线程数，None 表示使用 torch 默认值
+    num_interop_threads: Optional[int] = None
 
 @dataclass
 class InferenceConfig:
@@ -25,20 +33,158 @@ class InferenceConfig:
     early_stopping: bool = False
     do_sample: bool = False
 
+@dataclass
+class CascadeConfig:
+    """检测级联配置"""
+    enabled: bool = False
+    # 启发式评分不低于该值时认为图像可能有水印，小模型未检出则升级
+    heuristic_threshold: float = 0.5
+    # 小模型检出水印但启发式评分低于该值时视为分歧，升级到大模型复核
+    disagreement_threshold: float = 0.05
+
+@dataclass
+class InpaintPolicyConfig:
+    """分级修复配置：小而细、背景平坦的区域用 OpenCV 修复，其余用 LaMa"""
+    enabled: bool = False
+    # 区域面积上限（像素）及占整图百分比上限
+    max_area_px: int = 4000
+    max_area_percent: float = 0.5
+    # 区域外接框短边上限（像素），超过则视为块状区域
+    max_thickness_px: int = 40
+    # 区域外围拉普拉斯标准差上限，超过则视为纹理复杂
+    max_texture: float = 12.0
+    texture_ring: int = 6
+    # OpenCV 修复算法（telea / ns）及半径
+    opencv_method: str = "telea"
+    inpaint_radius: int = 3
+
+@dataclass
+class PoolConfig:
+    """模型池配置"""
+    # 模型常驻内存预算（MB），None 表示不限制；超出时按 LRU 淘汰
+    memory_budget_mb: Optional[float] = None
+    # 模型空闲超过该秒数后卸载，None 表示不卸载
+    idle_timeout_s: Optional[float] = None
+    # 登记到模型池的 iopaint 修复模型
+    inpaint_models: Tuple[str, ...] = ("lama",)
+
+@dataclass
+class MemoryConfig:
+    """内存看门狗配置"""
+    # 进程内存上限（MB），None 表示不预测也不降级
+    ceiling_mb: Optional[float] = None
+    # 峰值内存预测：每百万像素的解码/缓冲开销和 LaMa 推理开销（MB）
+    decode_mb_per_mp: float = 30.0
+    lama_mb_per_mp: float = 180.0
+    # 常规计划：iopaint 裁剪策略的参数，长边超过触发尺寸时只修复各掩膜外接框加边距的裁剪
+    crop_trigger_size: int = 800
+    crop_margin: int = 64
+    # 降级一：更早触发裁剪、更小的边距
+    small_crop_trigger_size: int = 512
+    small_crop_margin: int = 32
+    # 降级二：按固定尺寸分块修复
+    tile_size: int = 512
+    tile_margin: int = 64
+    # 每处理多少张图像回收一次分配器内存
+    cleanup_every: int = 10
+    sample_interval_s: float = 0.05
+
+@dataclass
+class DedupConfig:
+    """批内近重复检测配置"""
+    enabled: bool = False
+    # 感知哈希边长（位数为其平方）及判定为近重复的最大汉明距离
+    hash_size: int = 8
+    max_distance: int = 6
+    # 宽高比相对误差上限，避免把裁剪版本当作缩放版本
+    aspect_tolerance: float = 0.02
+    # 映射结果前校验成员与代表原图的掩膜外平均像素差
+    verify: bool = False
+    verify_max_diff: float = 8.0
+
+@dataclass
+class WatchConfig:
+    """监控目录守护模式配置"""
+    poll_interval_s: float = 2.0
+    # 轮询发现的文件在该时间内大小和修改时间不变才视为写入完成
+    settle_s: float = 2.0
+    batch_size: int = 8
+    use_inotify: bool = True
+    # 处理后的输入移动到监控目录下的这两个子目录
+    done_dir: str = "done"
+    failed_dir: str = "failed"
+
+@dataclass
+class ProfileConfig:
+    """性能剖析配置"""
+    # 输出目录，None 表示不剖析；也可通过环境变量 WATERMARK_PROFILE_DIR 开启（--watch 模式下不支持）
+    output_dir: Optional[str] = None
+    sample_interval_s: float = 0.005
+    torch_profiler: bool = True
+    # torch profiler 的采样窗口，按图像计：跳过前 wait 张（模型加载也在这一段），预热 warmup 张，
+    # 记录 active 张，共 repeat 轮（0 表示整个运行期间循环）
+    torch_wait: int = 1
+    torch_warmup: int = 1
+    torch_active: int = 3
+    torch_repeat: int = 1
+    top_n: int = 15
+
+@dataclass
+class CompileConfig:
+    """编译执行配置"""
+    enabled: bool = False
+    # torch.compile 后端及模式；inductor 在 CPU 上生成 C++ 内核
+    backend: str = "inductor"
+    mode: Optional[str] = None
+    # LaMa 输入的高和宽分别向上填充到这些尺寸（需为 8 的倍数），每种组合编译一次
+    buckets: Tuple[int, ...] = (256, 512, 768, 1024, 1280, 1664)
+    # 启动时预热的 (高, 宽) 桶
+    warmup_buckets: Tuple[Tuple[int, int], ...] = ((512, 512), (768, 768), (1024, 1024))
+
 @dataclass
 class ServerConfig:
     """服务器配置"""
     host: str = "0.0.0.0"
     port: int = 5566
     workers: int = 1
+    # 以 workers 个工作进程运行时每个进程的算子内线程数（本机调优结果，None 表示平分 CPU）
+    worker_threads: Optional[int] = None
     log_level: str = "info"
 
+def host_profile_path() -> Path:
+    """本机调优结果文件路径，可通过环境变量 WATERMARK_HOST_PROFILE 指定"""
+    return Path(os.environ.get("WATERMARK_HOST_PROFILE",
+                               Path.home() / ".cache" / "watermark-remove" / "host_profile.json"))
+
+def available_cpus() -> int:
+    """当前进程可用的 CPU 数（遵循 taskset / 容器 cpuset 限制）"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def host_fingerprint(device: str) -> Dict[str, Any]:
+    """标识调优结果所属的主机；任一字段不同时调优结果不再适用"""
+    cpu = platform.processor()
+    try:
+        with open("/proc/cpuinfo") as f:
+            cpu = next((line.split(":", 1)[1].strip() for line in f if line.startswith("model name")), cpu)
+    except OSError:
+        pass
+    return {
+        "machine": platform.machine(),
+        "cpu": cpu,
+        "cpus": available_cpus(),
+        "device": device,
+        "torch": torch.__version__,
+    }
+
 class ConfigManager:
     """配置管理器"""
     
     def __init__(self):
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self._setup_configs()
+        self.host_profile = self.load_host_profile()
     
     def _setup_configs(self):
         """根据设备类型设置配置"""
@@ -64,6 +210,14 @@ class ConfigManager:
                 num_beams=1  # CPU 环境下减少束搜索
             )
         
+        self.cascade_config = CascadeConfig()
+        self.pool_config = PoolConfig()
+        self.inpaint_policy_config = InpaintPolicyConfig()
+        self.memory_config = MemoryConfig()
+        self.dedup_config = DedupConfig()
+        self.watch_config = WatchConfig()
+        self.compile_config = CompileConfig()
+        self.profile_config = ProfileConfig(output_dir=os.environ.get("WATERMARK_PROFILE_DIR"))
         self.server_config = ServerConfig()
     
     def get_model_kwargs(self) -> Dict[str, Any]:
@@ -90,10 +244,48 @@ class ConfigManager:
         
         return base_kwargs
     
+    def load_host_profile(self, path: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+        """
+        加载 autotune.py 写出的本机调优结果，覆盖线程数和工作进程数
+
+        num_threads 是单进程的最优线程数；worker_threads 只在实际以 workers 个工作进程运行时使用
+
+        文件不存在、无法解析或来自其他主机（硬件、设备或 torch 版本不同）时保留默认配置
+        """
+        path = Path(path) if path else host_profile_path()
+        if not path.is_file():
+            return None
+        try:
+            profile = json.loads(path.read_text())
+            settings = profile["settings"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable host profile {path}: {e}")
+            return None
+        if profile.get("fingerprint") != host_fingerprint(self.device):
+            logger.warning(f"Host profile {path} was tuned on a different host, re-run autotune.py")
+            return None
+
+        if "worker_threads" not in settings and settings.get("workers", 1) > 1:
+            # Older profiles stored the per-worker split as num_threads, which would starve a single process
+            logger.warning(f"Host profile {path} predates separate worker thread counts, re-run autotune.py")
+            return None
+        self.model_config.num_threads = settings.get("num_threads", self.model_config.num_threads)
+        self.model_config.num_interop_threads = settings.get("num_interop_threads")
+        self.server_config.workers = settings.get("workers", self.server_config.workers)
+        self.server_config.worker_threads = settings.get("worker_threads")
+        logger.info(f"Loaded host profile {path}: {settings}")
+        return profile
+
     def setup_cpu_optimization(self):
         """设置 CPU 优化"""
         if self.device == "cpu" and self.model_config.num_threads:
             torch.set_num_threads(self.model_config.num_threads)
+            if self.model_config.num_interop_threads:
+                try:
+                    torch.set_num_interop_threads(self.model_config.num_interop_threads)
+                except RuntimeError:
+                    # 算子间线程池只能在首次并行计算前设置
+                    logger.warning("Inter-op thread count already fixed for this process, keeping it")
             # 设置 CPU 优化标志
             torch.backends.mkldnn.enabled = True
             if hasattr(torch.backends, 'mkl') and hasattr(torch.backends.mkl, 'enabled'):
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批内近重复检测
+用感知哈希把缩放或重新导出的同一张图聚类，每个聚类只以最高分辨率处理一次，
+再把掩膜和结果映射到其他成员的尺寸上
+"""
+
+import math
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+from loguru import logger
+
+from config import DedupConfig
+from image_buffer import ImageBuffer, make_transparent
+
+# 每个字节值的置位数，用于批量计算汉明距离
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+# 每次批量校验的哈希字节数上限
+_CHECK_CHUNK = 1 << 22
+
+
+@dataclass
+class ImageSignature:
+    """聚类所需的图像摘要"""
+    path: Path
+    size: Tuple[int, int]
+    hash: int
+
+    @property
+    def area(self) -> int:
+        return self.size[0] * self.size[1]
+
+    @property
+    def aspect(self) -> float:
+        return self.size[0] / self.size[1]
+
+
+def perceptual_hash(image: Image.Image, hash_size: int = 8) -> int:
+    """DCT 感知哈希（pHash）：低频系数与中位数比较得到 hash_size^2 位整数"""
+    gray = np.asarray(image.convert("L").resize((hash_size * 4, hash_size * 4), Image.BILINEAR), dtype=np.float32)
+    low = cv2.dct(gray)[:hash_size, :hash_size]
+    bits = (low > np.median(low)).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def image_signature(path: Path, hash_size: int = 8) -> ImageSignature:
+    """读取尺寸和感知哈希；JPEG 使用 draft 模式按缩小比例解码"""
+    with Image.open(path) as image:
+        size = image.size
+        image.draft("RGB", (hash_size * 16, hash_size * 16))
+        return ImageSignature(path=path, size=size, hash=perceptual_hash(image, hash_size))
+
+
+def _aspect_key(aspect: float, tolerance: float) -> int:
+    """
+    宽高比的对数分桶
+
+    桶宽为 -log(1 - tolerance)，宽高比相对误差不超过 tolerance 的两张图像落在同一桶或相邻桶
+    """
+    if tolerance >= 1:
+        return 0
+    width = -math.log1p(-tolerance) if tolerance > 0 else 1e-12
+    return math.floor(math.log(aspect) / width)
+
+
+def cluster_signatures(signatures: Sequence[Optional[ImageSignature]], dedup_config: DedupConfig) -> List[List[int]]:
+    """
+    按感知哈希的汉明距离和宽高比聚类，返回下标列表，None 的签名各自成为单独的聚类
+
+    把哈希位等分成 max_distance + 1 段：汉明距离不超过 max_distance 的两个哈希至少有一段完全相同
+    （鸽巢原理），因此只需比较某一段相同且宽高比落在相邻桶的候选，结果与两两比较一致。
+    每个桶的候选按矩阵用 NumPy 批量校验距离和宽高比。
+    """
+    # Component label of every image plus the members of each component; merging relabels the smaller side,
+    # so a whole row of matches is merged with a few array operations instead of one union per pair
+    labels = np.arange(len(signatures))
+    components: List[Optional[List[int]]] = [[i] for i in range(len(signatures))]
+
+    def merge(indices: np.ndarray):
+        groups = np.unique(labels[indices])
+        if groups.size < 2:
+            return
+        target = max(groups, key=lambda group: len(components[group]))
+        for group in groups:
+            if group != target:
+                moved = components[group]
+                components[group] = None
+                labels[moved] = target
+                components[target].extend(moved)
+
+    valid = [i for i, signature in enumerate(signatures) if signature is not None]
+    bits = dedup_config.hash_size ** 2
+    bands = min(dedup_config.max_distance + 1, bits)
+    edges = [bits * k // bands for k in range(bands + 1)]
+    byte_count = (bits + 7) // 8
+    hashes = np.zeros((len(signatures), byte_count), dtype=np.uint8)
+    aspects = np.ones(len(signatures))
+    buckets: Dict[tuple, List[int]] = {}
+    exact: Dict[Tuple[int, float], int] = {}
+    for i in valid:
+        signature = signatures[i]
+        # Identical signatures match exactly the same images, so only the first one is bucketed
+        first = exact.setdefault((signature.hash, signature.aspect), i)
+        if first != i:
+            merge(np.array([first, i]))
+            continue
+        hashes[i] = np.frombuffer(signature.hash.to_bytes(byte_count, "big"), dtype=np.uint8)
+        aspects[i] = signature.aspect
+        aspect_key = _aspect_key(signature.aspect, dedup_config.aspect_tolerance)
+        for band in range(bands):
+            value = (signature.hash >> edges[band]) & ((1 << (edges[band + 1] - edges[band])) - 1)
+            buckets.setdefault((band, value, aspect_key), []).append(i)
+
+    for (band, value, aspect_key), members in buckets.items():
+        neighbours = [buckets.get((band, value, aspect_key + offset), ()) for offset in (-1, 1)]
+        if len(members) == 1 and not any(neighbours):
+            continue
+        candidates = np.array(sorted(set(members).union(*neighbours)))
+        if np.unique(labels[candidates]).size == 1:
+            continue
+        members = np.array(members)
+        # Check the bucket as a members x candidates matrix, in row chunks so degenerate buckets stay bounded
+        rows = max(1, _CHECK_CHUNK // (candidates.size * byte_count))
+        for start in range(0, members.size, rows):
+            chunk = members[start:start + rows, None]
+            distance = _POPCOUNT[hashes[chunk] ^ hashes[candidates][None]].sum(axis=2)
+            close = (candidates[None] > chunk) & (distance <= dedup_config.max_distance)
+            aspect_error = np.abs(aspects[candidates][None] - aspects[chunk]) / aspects[chunk]
+            close &= aspect_error <= dedup_config.aspect_tolerance
+            for row in np.flatnonzero(close.any(axis=1)):
+                merge(np.append(candidates[close[row]], chunk[row]))
+
+    clusters = []
+    for members in sorted((sorted(members) for members in components if members), key=lambda m: m[0]):
+        members.sort(key=lambda i: -(signatures[i].area if signatures[i] else 0))
+        clusters.append(members)
+    return clusters
+
+
+def cluster_near_duplicates(paths: Sequence[Path], dedup_config: DedupConfig) -> List[List[Path]]:
+    """
+    按感知哈希的汉明距离和宽高比聚类
+
+    返回聚类列表，每个聚类第一个元素为分辨率最高的代表图像，保持输入中首次出现的顺序
+    """
+    signatures = []
+    for path in paths:
+        try:
+            signatures.append(image_signature(path, dedup_config.hash_size))
+        except OSError as e:
+            logger.warning(f"Cannot hash {path}: {e}")
+            signatures.append(None)
+    return [[paths[i] for i in members] for members in cluster_signatures(signatures, dedup_config)]
+
+
+def _resize(array: np.ndarray, size: Tuple[int, int], nearest: bool = False) -> np.ndarray:
+    if (array.shape[1], array.shape[0]) == size:
+        return array
+    shrink = size[0] * size[1] < array.shape[0] * array.shape[1]
+    interpolation = cv2.INTER_NEAREST if nearest else (cv2.INTER_AREA if shrink else cv2.INTER_LINEAR)
+    return cv2.resize(np.ascontiguousarray(array), size, interpolation=interpolation)
+
+
+def map_to_member(source: ImageBuffer, mask: np.ndarray, result: ImageBuffer, member: ImageBuffer,
+                  transparent: bool, verify_max_diff: Optional[float] = None) -> Optional[Tuple[ImageBuffer, np.ndarray]]:
+    """
+    把代表图像的掩膜和结果映射到成员图像尺寸
+
+    成员图像在掩膜外保留自身像素，掩膜内使用缩放后的代表结果。
+    设置 verify_max_diff 时，先比较缩放后的代表原图与成员原图在掩膜外的平均绝对差，
+    超过阈值返回 None，由调用方单独处理该成员。
+    """
+    member_mask = _resize(mask, member.size, nearest=True)
+    if verify_max_diff is not None:
+        outside = member_mask == 0
+        if outside.any():
+            scaled_source = _resize(source.rgb(), member.size)
+            diff = np.abs(scaled_source.astype(np.int16) - member.rgb().astype(np.int16))[outside].mean()
+            if diff > verify_max_diff:
+                logger.info(f"Near-duplicate check failed (mean diff {diff:.1f} > {verify_max_diff})")
+                return None
+
+    if transparent:
+        return make_transparent(member, member_mask), member_mask
+
+    scaled_result = _resize(result.rgb(), member.size)
+    composed = np.where(member_mask[..., None] > 0, scaled_result, member.rgb())
+    return ImageBuffer(composed, "RGB"), member_mask
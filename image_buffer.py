@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图像缓冲区
+在流水线各阶段之间传递 uint8 数组及其通道顺序，避免重复拷贝和颜色空间来回转换
+"""
+
+from dataclasses import dataclass
+from typing import Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+CHANNEL_ORDERS = ("RGB", "BGR", "RGBA", "L")
+# 解码时每个条带的字节数上限，另外不超过整图的 1/DECODE_MIN_STRIPS
+DECODE_STRIP_BYTES = 4 * 1024 * 1024
+DECODE_MIN_STRIPS = 8
+
+
+@dataclass
+class ImageBuffer:
+    """
+    uint8 图像数组 + 通道顺序
+
+    通道顺序转换（RGB <-> BGR）只返回视图，不复制数据；
+    只有在交给 PIL 编码时才做一次连续化拷贝。
+    """
+    array: np.ndarray
+    order: str = "RGB"
+
+    def __post_init__(self):
+        if self.order not in CHANNEL_ORDERS:
+            raise ValueError(f"order must be one of {CHANNEL_ORDERS}, got {self.order}")
+        if self.array.dtype != np.uint8:
+            self.array = np.clip(self.array, 0, 255).astype(np.uint8)
+
+    @classmethod
+    def from_pil(cls, image: Image.Image) -> "ImageBuffer":
+        """
+        从 PIL 图像创建可写数组
+
+        np.asarray / np.array 都会先生成整图 bytes 再拷贝，峰值为图像大小的两倍；
+        这里按行条带解码到预先分配的数组中，峰值只多一个条带，且数组可写，
+        交给会就地写入的修复模型时不必再拷贝
+        """
+        if image.mode not in CHANNEL_ORDERS:
+            image = image.convert("RGB")
+        width, height = image.size
+        channels = len(image.getbands())
+        array = np.empty((height, width, channels) if channels > 1 else (height, width), dtype=np.uint8)
+        rows = max(1, min(DECODE_STRIP_BYTES // max(1, width * channels), -(-height // DECODE_MIN_STRIPS)))
+        for top in range(0, height, rows):
+            bottom = min(height, top + rows)
+            array[top:bottom] = np.asarray(image.crop((0, top, width, bottom)))
+        return cls(array, image.mode)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(width, height)，与 PIL 一致"""
+        return self.array.shape[1], self.array.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.array.nbytes
+
+    def rgb(self) -> np.ndarray:
+        """RGB 顺序的数组；BGR 时返回反转通道的视图"""
+        if self.order == "RGB":
+            return self.array
+        if self.order == "BGR":
+            return self.array[..., ::-1]
+        raise ValueError(f"Cannot view {self.order} buffer as RGB")
+
+    def bgr(self) -> np.ndarray:
+        """BGR 顺序的数组；RGB 时返回反转通道的视图"""
+        if self.order == "BGR":
+            return self.array
+        if self.order == "RGB":
+            return self.array[..., ::-1]
+        raise ValueError(f"Cannot view {self.order} buffer as BGR")
+
+    def to_pil(self) -> Image.Image:
+        """
+        转换为 PIL 图像（唯一一次拷贝）
+
+        BGR 数据直接交给 PIL 的 "BGR" 解码器，不在 numpy 侧做通道转换；
+        通道反转视图则按其连续的底层数据解码。
+        """
+        if self.order not in ("RGB", "BGR"):
+            return Image.fromarray(self.array, self.order)
+
+        array, rawmode = self.array, self.order
+        if not array.flags.c_contiguous and array[..., ::-1].flags.c_contiguous:
+            array, rawmode = array[..., ::-1], "BGR" if self.order == "RGB" else "RGB"
+        return Image.frombuffer("RGB", self.size, np.ascontiguousarray(array), "raw", rawmode, 0, 1)
+
+
+def writable_array(array: np.ndarray) -> np.ndarray:
+    """
+    返回可写的 uint8 数组：已可写时原样返回，否则拷贝一次
+
+    from_pil() 分条解码到自有的 np.empty 数组，本身可写，这里不会拷贝；
+    只有调用方直接传入的只读数组（如 autotune.py 中的 np.asarray(pil_image)）才会被拷贝一次，
+    因为 iopaint 会写入输入数组
+    """
+    return np.require(array, dtype=np.uint8, requirements="W")
+
+
+def bboxes_to_mask_array(size: Tuple[int, int], bboxes: Sequence[Tuple[int, int, int, int]]) -> np.ndarray:
+    """直接在 numpy 上绘制矩形掩膜（与 ImageDraw.rectangle 一样包含右下边界）"""
+    width, height = size
+    mask = np.zeros((height, width), dtype=np.uint8)
+    for x1, y1, x2, y2 in bboxes:
+        mask[max(0, y1):max(0, y2 + 1), max(0, x1):max(0, x2 + 1)] = 255
+    return mask
+
+
+def make_transparent(buffer: ImageBuffer, mask: np.ndarray) -> ImageBuffer:
+    """将掩膜区域设为完全透明 (0, 0, 0, 0)，其余像素不透明"""
+    height, width = mask.shape
+    rgba = np.empty((height, width, 4), dtype=np.uint8)
+    rgba[..., :3] = buffer.rgb()
+    rgba[..., 3] = 255
+    rgba[mask > 0] = 0
+    return ImageBuffer(rgba, "RGBA")
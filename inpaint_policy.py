@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分级修复策略
+按面积、形状和周边纹理复杂度，把每个掩膜区域分配给 OpenCV 经典修复或 LaMa
+"""
+
+from dataclasses import dataclass, asdict
+from typing import Callable, List, Tuple
+
+import cv2
+import numpy as np
+
+from config import InpaintPolicyConfig
+
+OPENCV_METHODS = {
+    "telea": cv2.INPAINT_TELEA,
+    "ns": cv2.INPAINT_NS,
+}
+
+
+@dataclass
+class RegionReport:
+    """单个掩膜区域的路由结果"""
+    bbox: Tuple[int, int, int, int]  # x, y, w, h
+    area: int
+    texture: float
+    method: str
+    label: int = 0  # 连通域标签图中的值
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def _crop_box(x: int, y: int, w: int, h: int, margin: int, shape) -> Tuple[int, int, int, int]:
+    height, width = shape[:2]
+    return max(0, x - margin), max(0, y - margin), min(width, x + w + margin), min(height, y + h + margin)
+
+
+def region_texture(gray: np.ndarray, component: np.ndarray, ring: int) -> float:
+    """区域外围一圈像素的拉普拉斯标准差，衡量背景纹理复杂度"""
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * ring + 1, 2 * ring + 1))
+    around = cv2.dilate(component, kernel) & ~component
+    if not around.any():
+        return 0.0
+    laplacian = cv2.Laplacian(gray, cv2.CV_32F)
+    return float(laplacian[around > 0].std())
+
+
+def route_regions(image: np.ndarray, mask: np.ndarray,
+                  policy: InpaintPolicyConfig) -> Tuple[List[RegionReport], np.ndarray]:
+    """
+    对掩膜做连通域分析并为每个区域选择修复方法
+
+    返回 (RegionReport 列表, 连通域标签图)；区域掩膜按需从标签图的外接框裁剪中取出
+    （labels[y:y+h, x:x+w] == report.label），不为每个区域保存整图数组
+    """
+    binary = (mask > 0).astype(np.uint8)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    image_area = mask.shape[0] * mask.shape[1]
+    opencv_name = f"opencv-{policy.opencv_method}"
+
+    routed = []
+    for label in range(1, count):
+        x, y, w, h, area = (int(v) for v in stats[label])
+        x1, y1, x2, y2 = _crop_box(x, y, w, h, policy.texture_ring, mask.shape)
+        component = (labels[y1:y2, x1:x2] == label).astype(np.uint8) * 255
+        gray = cv2.cvtColor(image[y1:y2, x1:x2], cv2.COLOR_RGB2GRAY)
+        texture = region_texture(gray, component, policy.texture_ring)
+
+        small = area <= policy.max_area_px and area / image_area * 100 <= policy.max_area_percent
+        thin = min(w, h) <= policy.max_thickness_px
+        flat = texture <= policy.max_texture
+        method = opencv_name if small and thin and flat else "lama"
+
+        routed.append(RegionReport(bbox=(x, y, w, h), area=area, texture=round(texture, 2), method=method,
+                                   label=label))
+    return routed, labels
+
+
+def tiered_inpaint(image: np.ndarray, mask: np.ndarray, lama_fn: Callable[[np.ndarray, np.ndarray], np.ndarray],
+                   policy: InpaintPolicyConfig) -> Tuple[np.ndarray, List[RegionReport]]:
+    """
+    分级修复
+
+    image 为 RGB uint8 数组，mask 为单通道掩膜；lama_fn(image, mask) 需返回 RGB uint8 数组。
+    OpenCV 区域在其外接框附近的局部裁剪上修复，其余区域合并后一次性交给 LaMa。
+    """
+    routed, labels = route_regions(image, mask, policy)
+    result = image.copy()
+    flag = OPENCV_METHODS[policy.opencv_method]
+
+    for report in routed:
+        if report.method == "lama":
+            continue
+        x, y, w, h = report.bbox
+        margin = policy.inpaint_radius * 2 + 2
+        x1, y1, x2, y2 = _crop_box(x, y, w, h, margin, mask.shape)
+        crop_mask = (labels[y1:y2, x1:x2] == report.label).astype(np.uint8) * 255
+        result[y1:y2, x1:x2] = cv2.inpaint(result[y1:y2, x1:x2], crop_mask, policy.inpaint_radius, flag)
+
+    lama_labels = [report.label for report in routed if report.method == "lama"]
+    if lama_labels:
+        lama_mask = np.isin(labels, lama_labels).astype(np.uint8) * 255
+        result = lama_fn(result, lama_mask)
+
+    return result, routed
+
+
+def summarize_methods(reports: List[RegionReport]) -> str:
+    """将区域路由结果汇总为 "method=count" 形式"""
+    counts = {}
+    for report in reports:
+        counts[report.method] = counts.get(report.method, 0) + 1
+    return ",".join(f"{method}={count}" for method, count in sorted(counts.items())) or "none"
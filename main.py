@@ -1,104 +1,26 @@
-import sys
 import click
 from pathlib import Path
-import cv2
 import numpy as np
-from PIL import Image, ImageDraw
-from transformers import AutoProcessor, AutoModelForCausalLM
-from iopaint.model_manager import ModelManager
-from iopaint.schema import HDStrategy, LDMSampler, InpaintRequest as Config
+from PIL import Image
 import torch
-from torch.nn import Module
 import tqdm
 from loguru import logger
-from enum import Enum
-
-try:
-    from cv2.typing import MatLike
-except ImportError:
-    MatLike = np.ndarray
-
-
-class TaskType(str, Enum):
-    OPEN_VOCAB_DETECTION = "<OPEN_VOCABULARY_DETECTION>"
-    """Detect bounding box for objects and OCR text"""
-
-
-def identify(task_prompt: TaskType, image: MatLike, text_input: str, model: AutoModelForCausalLM,
-             processor: AutoProcessor, device: str):
-    if not isinstance(task_prompt, TaskType):
-        raise ValueError(f"task_prompt must be a TaskType, but {task_prompt} is of type {type(task_prompt)}")
-
-    prompt = task_prompt.value if text_input is None else task_prompt.value + text_input
-    inputs = processor(text=prompt, images=image, return_tensors="pt")
-    inputs = {k: v.to(device) for k, v in inputs.items()}
-
-    generated_ids = model.generate(
-        input_ids=inputs["input_ids"],
-        pixel_values=inputs["pixel_values"],
-        max_new_tokens=1024,
-        early_stopping=False,
-        do_sample=False,
-        num_beams=3,
-    )
-    generated_text = processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
-    return processor.post_process_generation(
-        generated_text, task=task_prompt.value, image_size=(image.width, image.height)
-    )
-
-
-def get_watermark_mask(image: MatLike, model: AutoModelForCausalLM, processor: AutoProcessor, device: str,
-                       max_bbox_percent: float):
-    text_input = "watermark"
-    task_prompt = TaskType.OPEN_VOCAB_DETECTION
-    parsed_answer = identify(task_prompt, image, text_input, model, processor, device)
-
-    mask = Image.new("L", image.size, 0)
-    draw = ImageDraw.Draw(mask)
-
-    detection_key = "<OPEN_VOCABULARY_DETECTION>"
-    if detection_key in parsed_answer and "bboxes" in parsed_answer[detection_key]:
-        image_area = image.width * image.height
-        for bbox in parsed_answer[detection_key]["bboxes"]:
-            x1, y1, x2, y2 = map(int, bbox)
-            bbox_area = (x2 - x1) * (y2 - y1)
-            if (bbox_area / image_area) * 100 <= max_bbox_percent:
-                draw.rectangle([x1, y1, x2, y2], fill=255)
-            else:
-                logger.warning(
-                    f"Skipping large bounding box: {bbox} covering {bbox_area / image_area:.2%} of the image")
-
-    return mask
-
-
-def process_image_with_lama(image: MatLike, mask: MatLike, model_manager: ModelManager):
-    config = Config(
-        ldm_steps=50,
-        ldm_sampler=LDMSampler.ddim,
-        hd_strategy=HDStrategy.CROP,
-        hd_strategy_crop_margin=64,
-        hd_strategy_crop_trigger_size=800,
-        hd_strategy_resize_limit=1600,
-    )
-    result = model_manager(image, mask, config)
-
-    if result.dtype in [np.float64, np.float32]:
-        result = np.clip(result, 0, 255).astype(np.uint8)
-
-    return result
-
-
-def make_region_transparent(image: Image.Image, mask: Image.Image):
-    image = image.convert("RGBA")
-    mask = mask.convert("L")
-    transparent_image = Image.new("RGBA", image.size)
-    for x in range(image.width):
-        for y in range(image.height):
-            if mask.getpixel((x, y)) > 0:
-                transparent_image.putpixel((x, y), (0, 0, 0, 0))
-            else:
-                transparent_image.putpixel((x, y), image.getpixel((x, y)))
-    return transparent_image
+
+from compiled import compile_stats
+from config import config
+from dedup import cluster_near_duplicates, map_to_member
+from image_buffer import ImageBuffer
+from inpaint_policy import summarize_methods
+from manifest import ManifestRecord, ManifestWriter, read_manifest
+from memory_guard import MemoryWatchdog, PLAN_DEFER, PLAN_TILED, is_out_of_memory, mask_boxes, summarize_memory
+from profiling import image_scope, maybe_profile
+from watch_folder import output_dirs, serve
+from worker_pool import SharedWorkerPool
+from watermark_remover import OUTPUT_FORMATS, WatermarkRemover, save_output
+
+
+def list_images(directory: Path):
+    return list(directory.glob("*.[jp][pn]g")) + list(directory.glob("*.webp"))
 
 
 @click.command()
@@ -107,77 +29,363 @@ def make_region_transparent(image: Image.Image, mask: Image.Image):
 @click.option("--overwrite", is_flag=True, help="Overwrite existing files in bulk mode.")
 @click.option("--transparent", is_flag=True, help="Make watermark regions transparent instead of removing.")
 @click.option("--max-bbox-percent", default=10.0, help="Maximum percentage of the image that a bounding box can cover.")
-@click.option("--force-format", type=click.Choice(["PNG", "WEBP", "JPG"], case_sensitive=False), default=None,
+@click.option("--force-format", type=click.Choice(OUTPUT_FORMATS, case_sensitive=False), default=None,
               help="Force output format. Defaults to input format.")
+@click.option("--cascade", is_flag=True,
+              help="Detect with Florence-2-base first and escalate to Florence-2-large only when uncertain.")
+@click.option("--inpaint-model", default="lama", help="iopaint model used for removal (lama, mat, ...).")
+@click.option("--memory-budget-mb", type=float, default=None,
+              help="Resident model memory budget. Least recently used models are evicted when exceeded.")
+@click.option("--idle-timeout", type=float, default=None, help="Unload models idle for more than this many seconds.")
+@click.option("--tiered-inpaint", is_flag=True,
+              help="Inpaint small, thin regions on flat backgrounds with OpenCV and only send the rest to LaMa.")
+@click.option("--memory-ceiling-mb", type=float, default=None,
+              help="Process memory ceiling. Inputs predicted to exceed it use smaller crops, tiles, or are retried last.")
+@click.option("--dedup", is_flag=True,
+              help="Process near-duplicate images once at their highest resolution and map the result to the rest.")
+@click.option("--dedup-verify", is_flag=True,
+              help="Check each near-duplicate against the processed copy before reusing its result.")
+@click.option("--watch", is_flag=True,
+              help="Daemon mode: keep models loaded and process files as they arrive in INPUT_PATH.")
+@click.option("--watch-dir", multiple=True, type=click.Path(exists=True, file_okay=False),
+              help="Additional directory to watch in daemon mode. Can be repeated; each watched directory then "
+                   "writes to its own subdirectory of OUTPUT_PATH.")
+@click.option("--profile", "profile_dir", type=click.Path(file_okay=False), default=None,
+              help="Profile the run and write stage-tagged traces and a flamegraph to this directory. "
+                   "Not available with --watch.")
+@click.option("--compile", "compiled", is_flag=True,
+              help="Compile the Florence-2 image encoder. Inpainting is not compiled for any bundled iopaint model "
+                   "(LaMa is TorchScript); only a custom forward(image, mask) network gets bucketed graphs.")
+@click.option("--detect-only", is_flag=True,
+              help="Only detect: write accepted boxes and RLE masks to OUTPUT_PATH as a JSONL manifest.")
+@click.option("--from-manifest", is_flag=True,
+              help="Treat INPUT_PATH as a manifest written by --detect-only and only inpaint.")
+@click.option("--workers", type=int, default=None,
+              help="Worker processes for directory mode (CPU only). Models are loaded once and shared read-only "
+                   "by forking. Off unless given; autotune.py reports a count for this host.")
 def main(input_path: str, output_path: str, overwrite: bool, transparent: bool, max_bbox_percent: float,
-         force_format: str):
+         force_format: str, cascade: bool, inpaint_model: str, memory_budget_mb: float, idle_timeout: float,
+         tiered_inpaint: bool, memory_ceiling_mb: float, dedup: bool, dedup_verify: bool, watch: bool,
+         watch_dir: tuple, profile_dir: str, compiled: bool, detect_only: bool, from_manifest: bool,
+         workers: int):
     input_path = Path(input_path)
     output_path = Path(output_path)
+    if detect_only and (from_manifest or watch):
+        raise click.BadParameter("--detect-only cannot be combined with --from-manifest or --watch",
+                                 param_hint="--detect-only")
+    if from_manifest and (watch or not input_path.is_file()):
+        raise click.BadParameter("--from-manifest needs a manifest file as INPUT_PATH and no --watch",
+                                 param_hint="--from-manifest")
+    if watch:
+        if not input_path.is_dir():
+            raise click.BadParameter("INPUT_PATH must be a directory in --watch mode", param_hint="INPUT_PATH")
+        # Every arrival is a new upload, so replace stale outputs of the same name
+        overwrite = True
 
     device = "cuda" if torch.cuda.is_available() else "cpu"
     print(f"Using device: {device}")
-    florence_model = AutoModelForCausalLM.from_pretrained("microsoft/Florence-2-large", trust_remote_code=True).to(
-        device).eval()
-    florence_processor = AutoProcessor.from_pretrained("microsoft/Florence-2-large", trust_remote_code=True)
-    logger.info("Florence-2 Model loaded")
-
-    if not transparent:
-        model_manager = ModelManager(name="lama", device=device)
-        logger.info("LaMa model loaded")
-
-    def handle_one(image_path: Path, output_path: Path):
+    # Thread counts come from the host profile written by autotune.py, if there is one
+    config.setup_cpu_optimization()
+    if memory_budget_mb is not None:
+        config.pool_config.memory_budget_mb = memory_budget_mb
+    if idle_timeout is not None:
+        config.pool_config.idle_timeout_s = idle_timeout
+    if memory_ceiling_mb is not None:
+        config.memory_config.ceiling_mb = memory_ceiling_mb
+    if profile_dir is not None:
+        config.profile_config.output_dir = profile_dir
+    profiling = bool(config.profile_config.output_dir)
+    if profiling and workers is not None and workers > 1:
+        # Stage events and stack samples are collected in-process; forked workers would drop theirs
+        raise click.BadParameter("--profile only covers a single process; drop --workers or set it to 1",
+                                 param_hint="--workers")
+    if profiling and watch:
+        # The daemon never exits, so stage events and stack samples would pile up with nothing written
+        raise click.BadParameter("--profile (or WATERMARK_PROFILE_DIR) cannot be combined with --watch; "
+                                 "profile a directory run instead", param_hint="--watch")
+    # Stage timings cover the whole run, torch ops a window of images; the summary is logged when the command exits
+    click.get_current_context().with_resource(maybe_profile(config.profile_config))
+    tiered = tiered_inpaint or config.inpaint_policy_config.enabled
+    remover = WatermarkRemover(device=device, cascade=cascade, inpaint_model=inpaint_model,
+                               max_bbox_percent=max_bbox_percent, tiered_inpaint=tiered, transparent=transparent,
+                               compiled=compiled, preload_detector=not from_manifest,
+                               preload_inpainter=not detect_only)
+    pool = remover.pool
+
+    memory_config = config.memory_config
+    watchdog = MemoryWatchdog(memory_config, device)
+
+    region_reports = []
+    records = []
+    deferred = []
+    # Detections read from the manifest in --from-manifest mode, kept RLE-encoded until used
+    manifest_entries = {}
+
+    def handle_one(image_path: Path, output_path: Path, retry: bool = False, on_result=None):
         if output_path.exists() and not overwrite:
             logger.info(f"Skipping existing file: {output_path}")
-            return
-
-        image = Image.open(image_path).convert("RGB")
-        mask_image = get_watermark_mask(image, florence_model, florence_processor, device, max_bbox_percent)
-
-        if transparent:
-            result_image = make_region_transparent(image, mask_image)
+            return None
+
+        # Check decoding and detection against the memory ceiling from the header alone; the inpaint
+        # plan depends on the mask and is chosen once it is known
+        with Image.open(image_path) as probe:
+            image_size = probe.size
+        plan, predicted_mb = watchdog.plan(image_size)
+        base_record = {"input_path": str(image_path), "output_path": str(output_path), "memory_plan": plan,
+                       "predicted_mb": round(predicted_mb, 1) if predicted_mb is not None else None}
+
+        def plan_for(mask: np.ndarray):
+            boxes = [] if transparent else mask_boxes(mask)
+            if retry:
+                return PLAN_TILED, watchdog.predict_mb(image_size, PLAN_TILED, boxes)
+            return watchdog.plan(image_size, boxes)
+
+        def defer(predicted: float):
+            logger.warning(f"Deferring {image_path}: predicted {predicted:.0f} MB exceeds the "
+                           f"{memory_config.ceiling_mb:.0f} MB memory ceiling")
+            deferred.append((image_path, output_path))
+
+        if plan == PLAN_DEFER and not retry:
+            defer(predicted_mb)
+            return {**base_record, "tier": "deferred"}
+
+        try:
+            with watchdog.track() as memory_stats, image_scope(image_path.name):
+                record = process_one(image_path, output_path, plan_for, on_result)
+        except (MemoryError, RuntimeError) as error:
+            if not is_out_of_memory(error):
+                raise
+            watchdog.cleanup()
+            if retry:
+                logger.error(f"Out of memory on {image_path} even in tiled mode")
+                return {**base_record, "tier": "failed"}
+            logger.warning(f"Out of memory on {image_path}, deferring to the retry pass")
+            deferred.append((image_path, output_path))
+            return {**base_record, "tier": "deferred"}
+
+        if record["tier"] == "deferred":
+            defer(record["predicted_mb"])
+            return {**base_record, **record}
+        record = {**base_record, **record, **memory_stats}
+        records.append(record)
+        logger.info(f"input_path:{image_path}, plan:{record['memory_plan']}, peak_rss_mb:{record['peak_rss_mb']}, "
+                    f"torch_peak_mb:{record['torch_peak_mb']}")
+        return record
+
+    def process_one(image_path: Path, output_path: Path, plan_for, on_result=None):
+        image = Image.open(image_path)
+        entry = manifest_entries.get(image_path)
+        if entry is None:
+            detection = remover.detect(image)
         else:
-            lama_result = process_image_with_lama(np.array(image), np.array(mask_image), model_manager)
-            result_image = Image.fromarray(cv2.cvtColor(lama_result, cv2.COLOR_BGR2RGB))
-
-        # Determine output format
-        if force_format:
-            output_format = force_format.upper()
-        elif transparent:
-            output_format = "PNG"
-        else:
-            output_format = image_path.suffix[1:].upper()
-            if output_format not in ["PNG", "WEBP", "JPG"]:
-                output_format = "PNG"
-
-        # Map JPG to JPEG for PIL compatibility
-        if output_format == "JPG":
-            output_format = "JPEG"
-
-        if transparent and output_format == "JPG":
-            logger.warning("Transparency detected. Defaulting to PNG for transparency support.")
-            output_format = "PNG"
-
-        new_output_path = output_path.with_suffix(f".{output_format.lower()}")
-        result_image.save(new_output_path, format=output_format)
-        logger.info(f"input_path:{image_path}, output_path:{new_output_path}")
-
-    if input_path.is_dir():
+            if image.size != entry.size:
+                raise ValueError(f"{image_path} is {image.size[0]}x{image.size[1]} but the manifest "
+                                 f"entry is {entry.size[0]}x{entry.size[1]}")
+            detection = entry.to_detection()
+        plan, predicted_mb = plan_for(detection.mask)
+        memory = {"memory_plan": plan, "predicted_mb": round(predicted_mb, 1) if predicted_mb is not None else None}
+        if plan == PLAN_DEFER:
+            return {**memory, "tier": "deferred"}
+        removal = remover.apply(image, detection, plan=plan)
+        regions = removal.regions
+        region_reports.extend(regions)
+        new_output_path = save_output(removal.image, image_path, output_path, transparent, force_format)
+        if on_result is not None:
+            on_result(removal.source, removal.mask, removal.result)
+        logger.info(f"input_path:{image_path}, output_path:{new_output_path}, tier:{detection.tier}"
+                    + (f", regions:{summarize_methods(regions)}" if tiered else ""))
+        for region in regions:
+            logger.debug(f"  region {region.bbox} area={region.area} texture={region.texture} -> {region.method}")
+        return {**memory, "input_path": str(image_path), "output_path": str(new_output_path), "tier": detection.tier,
+                "escalation_reason": detection.escalation_reason,
+                "regions": [region.to_dict() for region in regions]}
+
+    dedup_config = config.dedup_config
+    if dedup_verify:
+        dedup_config.verify = True
+    use_dedup = dedup or dedup_config.enabled
+    duplicates = []
+
+    def fan_out(representative: Path, members, fanned: dict):
+        def on_result(source: ImageBuffer, mask: np.ndarray, result: ImageBuffer):
+            for member in members:
+                output_file = output_path / member.name
+                if output_file.exists() and not overwrite:
+                    continue
+                member_buffer = ImageBuffer.from_pil(Image.open(member).convert("RGB"))
+                verify_max_diff = dedup_config.verify_max_diff if dedup_config.verify else None
+                mapped = map_to_member(source, mask, result, member_buffer, transparent, verify_max_diff)
+                if mapped is None:
+                    continue
+                new_output_path = save_output(mapped[0].to_pil(), member, output_file, transparent, force_format)
+                fanned[member] = {"input_path": str(member), "output_path": str(new_output_path),
+                                  "tier": "duplicate", "duplicate_of": str(representative)}
+                duplicates.append(fanned[member])
+                logger.info(f"input_path:{member}, output_path:{new_output_path}, duplicate_of:{representative}")
+        return on_result
+
+    def report(image_path: Path, output_file: Path, record, progress: int):
+        tier = record["tier"] if record else "skipped"
+        print(f"input_path:{image_path}, output_path:{output_file}, overall_progress:{progress}, tier:{tier}")
+
+    def run_retry_pass():
+        if not deferred:
+            return {}
+        # Retry pass: release everything that can be released, then process the deferred files tile by tile
+        retry_queue = list(deferred)
+        deferred.clear()
+        logger.info(f"Retrying {len(retry_queue)} deferred file(s) in tiled mode")
+        pool.evict_idle()
+        watchdog.cleanup()
+        results = {}
+        for image_path, output_file in retry_queue:
+            record = handle_one(image_path, output_file, retry=True)
+            report(image_path, output_file, record, 100)
+            results[image_path] = record
+        return results
+
+    if watch:
+        directories = [input_path, *map(Path, watch_dir)]
+        targets = output_dirs(directories, output_path)
+
+        def process_batch(paths):
+            outcomes = {}
+            for image_path in paths:
+                output_file = targets[image_path.parent] / image_path.name
+                try:
+                    record = handle_one(image_path, output_file)
+                except Exception:
+                    logger.exception(f"Failed to process {image_path}")
+                    outcomes[image_path] = False
+                    continue
+                if record is not None and record["tier"] == "deferred":
+                    continue
+                report(image_path, output_file, record, 100)
+                outcomes[image_path] = record is None or record["tier"] != "failed"
+            try:
+                for image_path, record in run_retry_pass().items():
+                    outcomes[image_path] = record is not None and record["tier"] != "failed"
+            except Exception:
+                logger.exception("Retry pass failed")
+            # The daemon runs indefinitely: report per batch and drop the per-image state
+            if tiered:
+                logger.info(f"Batch inpainted regions: {summarize_methods(region_reports)}")
+            logger.info(f"Batch memory: {summarize_memory(records)}")
+            records.clear()
+            region_reports.clear()
+            return outcomes
+
+        for target in targets.values():
+            target.mkdir(parents=True, exist_ok=True)
+        pool.start_reaper()
+        serve(directories, process_batch, config.watch_config)
+        logger.info(f"Model pool: {pool.stats()}")
+        if compiled:
+            logger.info(f"Compile cache: {compile_stats.summary()}")
+        return
+
+    if detect_only:
+        images = list_images(input_path) if input_path.is_dir() else [input_path]
+        with ManifestWriter(output_path) as writer:
+            for image_path in tqdm.tqdm(images, desc="Detecting watermarks"):
+                with image_scope(image_path.name), Image.open(image_path) as image:
+                    detection = remover.detect(image)
+                entry = ManifestRecord.from_detection(image_path, image.size, detection)
+                writer.write(entry)
+                print(f"input_path:{image_path}, boxes:{len(entry.accepted_bboxes)}, tier:{detection.tier}")
+        logger.info(f"Wrote detections for {len(images)} image(s) to {output_path}")
+        return
+
+    if from_manifest:
+        output_path.mkdir(parents=True, exist_ok=True)
+        entries = list(read_manifest(input_path))
+        for done, entry in enumerate(tqdm.tqdm(entries, desc="Inpainting from manifest"), start=1):
+            image_path = Path(entry.input_path)
+            manifest_entries[image_path] = entry
+            output_file = output_path / image_path.name
+            record = handle_one(image_path, output_file)
+            report(image_path, output_file, record, int(done / len(entries) * 100))
+    elif input_path.is_dir():
         if not output_path.exists():
             output_path.mkdir(parents=True)
 
-        images = list(input_path.glob("*.[jp][pn]g")) + list(input_path.glob("*.webp"))
+        images = list_images(input_path)
         total_images = len(images)
 
-        for idx, image_path in enumerate(tqdm.tqdm(images, desc="Processing images")):
-            output_file = output_path / image_path.name
-            handle_one(image_path, output_file)
-            progress = int((idx + 1) / total_images * 100)
-            print(f"input_path:{image_path}, output_path:{output_file}, overall_progress:{progress}")
+        if use_dedup:
+            clusters = cluster_near_duplicates(images, dedup_config)
+            logger.info(f"{total_images} images in {len(clusters)} near-duplicate clusters")
+        else:
+            clusters = [[image_path] for image_path in images]
+
+        def process_cluster(cluster):
+            representative, members = cluster[0], cluster[1:]
+            fanned = {}
+            output_file = output_path / representative.name
+            outcomes = [(representative, output_file,
+                         handle_one(representative, output_file,
+                                    on_result=fan_out(representative, members, fanned) if members else None))]
+            for member in members:
+                # Members the representative could not be mapped onto are processed on their own
+                output_file = output_path / member.name
+                outcomes.append((member, output_file, fanned.get(member) or handle_one(member, output_file)))
+            return outcomes
+
+        def process_cluster_in_worker(cluster):
+            # Runs in a forked worker: hand back what this cluster added to the worker's copies of the run state
+            collected = (records, region_reports, deferred, duplicates)
+            for items in collected:
+                items.clear()
+            outcomes = process_cluster(cluster)
+            return outcomes, [list(items) for items in collected]
+
+        if workers is None and device == "cpu" and config.server_config.workers > 1:
+            logger.info(f"The host profile suggests --workers {config.server_config.workers}")
+        workers = workers or 1
+        if workers > 1 and device != "cpu":
+            raise click.BadParameter("--workers needs the CPU device; CUDA contexts cannot be shared by forking",
+                                     param_hint="--workers")
+        workers = min(workers, len(clusters))
+
+        done = 0
+        progress_bar = tqdm.tqdm(total=total_images, desc="Processing images")
+
+        def report_cluster(outcomes):
+            nonlocal done
+            for image_path, output_file, record in outcomes:
+                done += 1
+                progress_bar.update(1)
+                report(image_path, output_file, record, int(done / total_images * 100))
+
+        if workers > 1:
+            # The tuned per-worker thread count only applies to the worker count it was measured with
+            server_config = config.server_config
+            threads = server_config.worker_threads if workers == server_config.workers else None
+            with SharedWorkerPool(remover, workers, process_cluster_in_worker, threads) as worker_pool:
+                for outcomes, collected in worker_pool.map(clusters):
+                    for items, worker_items in zip((records, region_reports, deferred, duplicates), collected):
+                        items.extend(worker_items)
+                    report_cluster(outcomes)
+        else:
+            for cluster in clusters:
+                report_cluster(process_cluster(cluster))
+        progress_bar.close()
     else:
         output_file = output_path.with_suffix(".webp" if transparent else output_path.suffix)
-        handle_one(input_path, output_file)
-        print(f"input_path:{input_path}, output_path:{output_file}, overall_progress:100")
+        record = handle_one(input_path, output_file)
+        if not deferred:
+            report(input_path, output_file, record, 100)
+
+    run_retry_pass()
+    if use_dedup:
+        logger.info(f"Near-duplicate fan-out reused results for {len(duplicates)} image(s)")
+    if tiered:
+        logger.info(f"Inpainted regions: {summarize_methods(region_reports)}")
+    logger.info(f"Memory: {summarize_memory(records)}")
+    logger.info(f"Model pool: {pool.stats()}")
+    if compiled:
+        logger.info(f"Compile cache: {compile_stats.summary()}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
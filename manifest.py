@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+检测清单
+仅检测模式把每张图像的检测框和 RLE 掩膜写成 JSONL 清单，修复模式读取清单只做修复，
+使检测和修复可以在不同规模的机器池上分别运行，也便于在修复前人工复核掩膜
+"""
+
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from cascade import BBox, DetectionResult
+
+MANIFEST_VERSION = 1
+
+
+def rle_encode(mask: np.ndarray) -> Dict:
+    """
+    把掩膜编码为未压缩 RLE
+
+    按行优先顺序展开（水印多为横向文字，行优先的游程更少），
+    counts 交替记录背景和前景的游程长度，第一个游程总是背景（可以为 0）
+    """
+    flat = (np.asarray(mask) > 0).ravel()
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    boundaries = np.concatenate(([0], changes, [flat.size]))
+    counts = np.diff(boundaries).tolist()
+    if flat.size and flat[0]:
+        counts.insert(0, 0)
+    return {"size": [int(mask.shape[0]), int(mask.shape[1])], "counts": counts}
+
+
+def rle_decode(rle: Dict) -> np.ndarray:
+    """把 rle_encode() 的结果还原为 uint8 掩膜（前景为 255）"""
+    height, width = rle["size"]
+    values = np.zeros(len(rle["counts"]), dtype=np.uint8)
+    values[1::2] = 255
+    flat = np.repeat(values, rle["counts"])
+    return flat.reshape((height, width))
+
+
+@dataclass
+class ManifestRecord:
+    """清单中的一行：一张图像的检测结果"""
+    input_path: str
+    size: Tuple[int, int]
+    tier: str
+    accepted_bboxes: List[BBox] = field(default_factory=list)
+    rejected_bboxes: List[BBox] = field(default_factory=list)
+    heuristic_score: Optional[float] = None
+    escalation_reason: Optional[str] = None
+    mask: Optional[Dict] = None
+
+    @classmethod
+    def from_detection(cls, input_path: Path, size: Tuple[int, int], detection: DetectionResult) -> "ManifestRecord":
+        return cls(
+            input_path=str(input_path),
+            size=size,
+            tier=detection.tier,
+            accepted_bboxes=[tuple(map(int, bbox)) for bbox in detection.accepted_bboxes],
+            rejected_bboxes=[tuple(map(int, bbox)) for bbox in detection.rejected_bboxes],
+            heuristic_score=detection.heuristic_score,
+            escalation_reason=detection.escalation_reason,
+            mask=rle_encode(detection.mask),
+        )
+
+    def to_detection(self) -> DetectionResult:
+        """还原为 DetectionResult，供 WatermarkRemover.apply() 使用"""
+        width, height = self.size
+        mask = rle_decode(self.mask) if self.mask else np.zeros((height, width), dtype=np.uint8)
+        if mask.shape != (height, width):
+            raise ValueError(f"Mask of {self.input_path} is {mask.shape[1]}x{mask.shape[0]}, "
+                             f"image is {width}x{height}")
+        return DetectionResult(mask=mask, tier=self.tier, accepted_bboxes=self.accepted_bboxes,
+                               rejected_bboxes=self.rejected_bboxes, heuristic_score=self.heuristic_score,
+                               escalation_reason=self.escalation_reason)
+
+    def to_json(self) -> str:
+        return json.dumps({"version": MANIFEST_VERSION, **self.__dict__, "size": list(self.size)},
+                          separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, line: str) -> "ManifestRecord":
+        data = json.loads(line)
+        version = data.pop("version", MANIFEST_VERSION)
+        if version != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported manifest version {version}")
+        data["size"] = tuple(data["size"])
+        for key in ("accepted_bboxes", "rejected_bboxes"):
+            data[key] = [tuple(map(int, bbox)) for bbox in data.get(key, [])]
+        return cls(**data)
+
+
+class ManifestWriter:
+    """逐行追加写入清单，每行写完即刷新，中断后已写入的记录仍然可用"""
+
+    def __init__(self, path: Path, append: bool = False):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a" if append else "w", encoding="utf-8")
+
+    def write(self, record: ManifestRecord):
+        self._file.write(record.to_json() + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_manifest(path: Path) -> Iterator[ManifestRecord]:
+    """
+    逐行读取清单，跳过空行
+
+    相对路径的 input_path 若在当前目录下不存在，则按清单所在目录解析
+    """
+    path = Path(path)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = ManifestRecord.from_json(line)
+            input_path = Path(record.input_path)
+            if not input_path.is_absolute() and not input_path.exists() and (path.parent / input_path).exists():
+                record.input_path = str(path.parent / input_path)
+            yield record
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内存看门狗
+记录每张图像的峰值 RSS 和 torch 显存，检测后按掩膜预测内存并选择降级策略，并定期回收分配器内存
+"""
+
+import ctypes
+import gc
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+import torch
+from loguru import logger
+
+from config import MemoryConfig
+from model_pool import MB, current_rss
+
+# 处理计划，按内存占用从高到低排列
+PLAN_NORMAL = "normal"
+PLAN_SMALL_CROPS = "small_crops"
+PLAN_TILED = "tiled"
+PLAN_DEFER = "defer"
+
+Box = Tuple[int, int, int, int]
+
+# CPU 分配失败时 torch 抛出的是 RuntimeError，只能按错误信息识别
+_OOM_MESSAGES = ("out of memory", "can't allocate memory", "not enough memory")
+
+
+def is_out_of_memory(error: BaseException) -> bool:
+    """判断异常是否为内存不足（MemoryError、CUDA OOM 或 torch CPU 分配器失败）"""
+    if isinstance(error, MemoryError):
+        return True
+    return isinstance(error, RuntimeError) and any(text in str(error).lower() for text in _OOM_MESSAGES)
+
+
+def mask_boxes(mask: np.ndarray) -> List[Box]:
+    """掩膜各连通区域的外接框 (x1, y1, x2, y2)，与 iopaint 裁剪策略划分裁剪的方式一致"""
+    binary = (np.asarray(mask) > 127).astype(np.uint8)
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        boxes.append((x, y, x + w, y + h))
+    return boxes
+
+
+def crop_megapixels(image_size: Tuple[int, int], boxes: Sequence[Box], trigger_size: int, margin: int) -> float:
+    """
+    iopaint 裁剪策略下单次 LaMa 推理的最大输入（百万像素）
+
+    长边不超过触发尺寸时整图推理；否则逐个外接框加边距裁剪推理（裁剪不超出图像），峰值取决于最大的裁剪
+    """
+    if not boxes:
+        return 0.0
+    width, height = image_size
+    if max(width, height) <= trigger_size:
+        return width * height / 1e6
+    return max(min(x2 - x1 + 2 * margin, width) * min(y2 - y1 + 2 * margin, height)
+               for x1, y1, x2, y2 in boxes) / 1e6
+
+
+def _malloc_trim():
+    """把 glibc 空闲堆内存归还给操作系统，非 glibc 平台忽略"""
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+class PeakSampler:
+    """后台线程定时采样 RSS，记录区间内峰值"""
+
+    def __init__(self, interval_s: float):
+        self.interval_s = interval_s
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+class MemoryWatchdog:
+    """
+    内存看门狗
+
+    解码前只按图像尺寸预测解码和检测的内存；检测后按掩膜外接框预测 LaMa 的输入大小，
+    超过上限时依次尝试更小的裁剪、分块修复，仍然超限则推迟到最后的重试轮次。
+    处理过程中采样峰值 RSS 和 torch 显存。
+    """
+
+    def __init__(self, memory_config: MemoryConfig, device: str):
+        self.config = memory_config
+        self.device = device
+        self._processed = 0
+
+    def inpaint_megapixels(self, image_size: Tuple[int, int], plan: str, boxes: Sequence[Box]) -> float:
+        """按计划执行时单次 LaMa 推理的最大输入（百万像素），没有掩膜时为 0"""
+        config = self.config
+        if plan == PLAN_SMALL_CROPS:
+            return crop_megapixels(image_size, boxes, config.small_crop_trigger_size, config.small_crop_margin)
+        if plan == PLAN_TILED:
+            if not boxes:
+                return 0.0
+            side = config.tile_size + 2 * config.tile_margin
+            return min(side, image_size[0]) * min(side, image_size[1]) / 1e6
+        return crop_megapixels(image_size, boxes, config.crop_trigger_size, config.crop_margin)
+
+    def predict_mb(self, image_size: Tuple[int, int], plan: str = PLAN_NORMAL, boxes: Sequence[Box] = ()) -> float:
+        """预测处理该图像时的进程峰值内存（MB）；boxes 为空时只计解码和检测"""
+        megapixels = image_size[0] * image_size[1] / 1e6
+        predicted = current_rss() / MB + megapixels * self.config.decode_mb_per_mp
+        return predicted + self.inpaint_megapixels(image_size, plan, boxes) * self.config.lama_mb_per_mp
+
+    def plan(self, image_size: Tuple[int, int], boxes: Sequence[Box] = ()) -> Tuple[str, Optional[float]]:
+        """返回 (处理计划, 预测峰值 MB)；未设置上限时总是 normal"""
+        ceiling = self.config.ceiling_mb
+        if ceiling is None:
+            return PLAN_NORMAL, None
+        for plan in (PLAN_NORMAL, PLAN_SMALL_CROPS, PLAN_TILED):
+            predicted = self.predict_mb(image_size, plan, boxes)
+            if predicted <= ceiling:
+                return plan, predicted
+            if not boxes:
+                break
+        return PLAN_DEFER, self.predict_mb(image_size, PLAN_TILED, boxes)
+
+    @contextmanager
+    def track(self) -> Iterator[Dict]:
+        """统计代码块内的峰值 RSS 和 torch 显存，结果写入 yield 出的字典"""
+        stats: Dict = {}
+        use_cuda = self.device == "cuda" and torch.cuda.is_available()
+        if use_cuda:
+            torch.cuda.reset_peak_memory_stats()
+        start = time.perf_counter()
+        with PeakSampler(self.config.sample_interval_s) as sampler:
+            try:
+                yield stats
+            finally:
+                stats["seconds"] = round(time.perf_counter() - start, 3)
+        stats["peak_rss_mb"] = round(sampler.peak / MB, 1)
+        stats["torch_peak_mb"] = round(torch.cuda.max_memory_allocated() / MB, 1) if use_cuda else None
+        self._after_image()
+
+    def _after_image(self):
+        self._processed += 1
+        if self.config.cleanup_every and self._processed % self.config.cleanup_every == 0:
+            self.cleanup()
+
+    def cleanup(self):
+        """回收 Python 垃圾、torch 缓存和 glibc 空闲堆"""
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        _malloc_trim()
+        logger.debug(f"Allocator cleanup, RSS now {current_rss() / MB:.0f} MB")
+
+
+def summarize_memory(records: List[Dict]) -> str:
+    """汇总各图像的内存统计，用于运行结束时的报告"""
+    peaks = [r["peak_rss_mb"] for r in records if r.get("peak_rss_mb") is not None]
+    torch_peaks = [r["torch_peak_mb"] for r in records if r.get("torch_peak_mb") is not None]
+    plans: Dict[str, int] = {}
+    for record in records:
+        plan = record.get("memory_plan")
+        if plan:
+            plans[plan] = plans.get(plan, 0) + 1
+
+    parts = []
+    if peaks:
+        parts.append(f"peak RSS max {max(peaks):.0f} MB, mean {sum(peaks) / len(peaks):.0f} MB")
+    if torch_peaks:
+        parts.append(f"torch peak max {max(torch_peaks):.0f} MB")
+    if plans:
+        parts.append("plans " + ",".join(f"{plan}={count}" for plan, count in sorted(plans.items())))
+    return "; ".join(parts) or "no images processed"
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型池
+按需加载模型，统计常驻内存，超出预算时按 LRU 淘汰，并卸载长时间空闲的模型
+"""
+
+import gc
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import torch
+from loguru import logger
+from transformers import AutoProcessor, AutoModelForCausalLM
+
+from compiled import compile_florence, compile_inpaint_model
+from config import CompileConfig, ModelConfig, PoolConfig
+
+MB = 1024 * 1024
+
+
+def load_florence(model_name: str, device: str, compile_config: Optional[CompileConfig] = None):
+    """加载 Florence-2 模型和处理器"""
+    model = AutoModelForCausalLM.from_pretrained(model_name, trust_remote_code=True).to(device).eval()
+    processor = AutoProcessor.from_pretrained(model_name, trust_remote_code=True)
+    if compile_config is not None and compile_config.enabled:
+        model = compile_florence(model, processor, model_name, compile_config)
+    return model, processor
+
+
+def load_iopaint(name: str, device: str, compile_config: Optional[CompileConfig] = None):
+    """加载 iopaint 修复模型（lama、mat、ldm 等）"""
+    from iopaint.model_manager import ModelManager
+    model_manager = ModelManager(name=name, device=device)
+    if compile_config is not None and compile_config.enabled:
+        model_manager = compile_inpaint_model(model_manager, name, compile_config)
+    return model_manager
+
+
+def current_rss() -> int:
+    """当前进程常驻内存（字节），非 Linux 平台返回 0"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def tensor_nbytes(obj: Any, _depth: int = 0) -> int:
+    """统计对象持有的 torch 参数和缓冲区字节数（向下查找 model 属性）"""
+    if isinstance(obj, torch.nn.Module):
+        tensors = list(obj.parameters()) + list(obj.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    if isinstance(obj, (tuple, list)):
+        return sum(tensor_nbytes(item, _depth) for item in obj)
+    if _depth < 3 and hasattr(obj, "model"):
+        return tensor_nbytes(obj.model, _depth + 1)
+    return 0
+
+
+@dataclass
+class PooledModel:
+    """池中一个已加载的模型"""
+    name: str
+    value: Any
+    nbytes: int
+    last_used: float
+
+
+class ModelPool:
+    """
+    带内存预算的模型注册表
+
+    通过 register() 登记加载函数，get() 时按需加载。
+    常驻内存按模型张量大小计算（无张量时退化为加载前后的 RSS 差值）。
+    卸载后仍记住模型大小，再次加载前先按 LRU 腾出空间，新旧模型不会同时超出预算。
+    正在使用的模型应通过 lease() / pin() 标记，空闲回收和预算淘汰会跳过它们。
+    """
+
+    def __init__(self, device: str, pool_config: PoolConfig, compile_config: Optional[CompileConfig] = None):
+        self.device = device
+        self.config = pool_config
+        self.compile_config = compile_config
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._loaded: "OrderedDict[str, PooledModel]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._in_use: Counter = Counter()
+        # 加载过的模型大小，卸载后保留，用于重新加载前腾出空间
+        self._known_nbytes: Dict[str, int] = {}
+        self._reaper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def budget_bytes(self) -> Optional[int]:
+        if self.config.memory_budget_mb is None:
+            return None
+        return int(self.config.memory_budget_mb * MB)
+
+    @property
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(entry.nbytes for entry in self._loaded.values())
+
+    def register(self, name: str, loader: Callable[[], Any]):
+        """登记模型加载函数，不立即加载"""
+        self._loaders[name] = loader
+
+    def register_florence(self, model_name: str):
+        self.register(model_name, lambda: load_florence(model_name, self.device, self.compile_config))
+
+    def register_iopaint(self, name: str):
+        self.register(name, lambda: load_iopaint(name, self.device, self.compile_config))
+
+    def is_loaded(self, name: str) -> bool:
+        with self._lock:
+            return name in self._loaded
+
+    def get(self, name: str) -> Any:
+        """获取模型，未加载时加载，并更新 LRU 顺序"""
+        with self._lock:
+            self.evict_idle(keep=name)
+            entry = self._loaded.get(name)
+            if entry is None:
+                self._make_room(name)
+                entry = self._load(name)
+            entry.last_used = time.monotonic()
+            self._loaded.move_to_end(name)
+            self._enforce_budget(keep=name)
+            return entry.value
+
+    @contextmanager
+    def pin(self, *names: str) -> Iterator[None]:
+        """标记模型正在使用（无论是否已加载），期间不会被回收；结束时刷新最近使用时间"""
+        with self._lock:
+            self._in_use.update(names)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_use.subtract(names)
+                now = time.monotonic()
+                for name in names:
+                    if self._in_use[name] <= 0:
+                        del self._in_use[name]
+                    if name in self._loaded:
+                        self._loaded[name].last_used = now
+
+    @contextmanager
+    def lease(self, name: str) -> Iterator[Any]:
+        """获取模型并在使用期间保持加载，适合一次获取后长时间使用（如逐块修复）"""
+        with self.pin(name):
+            yield self.get(name)
+
+    def _load(self, name: str) -> PooledModel:
+        if name not in self._loaders:
+            raise KeyError(f"Model '{name}' is not registered in the pool")
+        rss_before = current_rss()
+        start = time.perf_counter()
+        value = self._loaders[name]()
+        nbytes = tensor_nbytes(value) or max(0, current_rss() - rss_before)
+        entry = PooledModel(name=name, value=value, nbytes=nbytes, last_used=time.monotonic())
+        self._loaded[name] = entry
+        self._known_nbytes[name] = nbytes
+        logger.info(f"Loaded {name} ({nbytes / MB:.0f} MB) in {time.perf_counter() - start:.1f}s, "
+                    f"pool resident {self.resident_bytes / MB:.0f} MB")
+        return entry
+
+    def unload(self, name: str):
+        """卸载指定模型并释放内存"""
+        with self._lock:
+            entry = self._loaded.pop(name, None)
+        if entry is None:
+            return
+        logger.info(f"Unloading {name} ({entry.nbytes / MB:.0f} MB)")
+        del entry
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _evict_until(self, limit: int, keep: str) -> bool:
+        """按 LRU 卸载未在使用的模型，直到常驻内存不超过 limit；无法做到时返回 False"""
+        while self.resident_bytes > limit:
+            victim = next((name for name in self._loaded if name != keep and name not in self._in_use), None)
+            if victim is None:
+                return False
+            self.unload(victim)
+        return True
+
+    def _make_room(self, name: str):
+        """已知模型大小时，在加载前先淘汰，避免被淘汰的模型与新模型同时驻留"""
+        budget = self.budget_bytes
+        incoming = self._known_nbytes.get(name)
+        if budget is None or incoming is None:
+            return
+        self._evict_until(max(0, budget - incoming), keep=name)
+
+    def _enforce_budget(self, keep: str):
+        budget = self.budget_bytes
+        if budget is None:
+            return
+        if not self._evict_until(budget, keep):
+            logger.warning(f"{keep} and the models in use exceed the pool memory budget "
+                           f"({self.resident_bytes / MB:.0f} MB > {budget / MB:.0f} MB)")
+
+    def evict_idle(self, keep: Optional[str] = None):
+        """卸载空闲时间超过 idle_timeout_s 的模型"""
+        timeout = self.config.idle_timeout_s
+        if timeout is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            idle = [name for name, entry in self._loaded.items()
+                    if name != keep and name not in self._in_use and now - entry.last_used > timeout]
+        for name in idle:
+            self.unload(name)
+
+    def start_reaper(self, interval_s: float = 30.0):
+        """启动后台线程定期回收空闲模型（长驻进程使用）"""
+        if self._reaper is not None or self.config.idle_timeout_s is None:
+            return
+
+        def _run():
+            while not self._stop.wait(interval_s):
+                self.evict_idle()
+
+        self._reaper = threading.Thread(target=_run, name="model-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def close(self):
+        """停止后台回收并卸载全部模型"""
+        self._stop.set()
+        for name in list(self._loaded):
+            self.unload(name)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "resident_mb": round(self.resident_bytes / MB, 1),
+                "budget_mb": self.config.memory_budget_mb,
+                "models": {name: round(entry.nbytes / MB, 1) for name, entry in self._loaded.items()},
+            }
+
+
+def create_model_pool(device: str, model_config: ModelConfig, pool_config: PoolConfig,
+                      compile_config: Optional[CompileConfig] = None) -> ModelPool:
+    """创建模型池并登记 Florence-2 base/large 和配置的 iopaint 修复模型"""
+    pool = ModelPool(device, pool_config, compile_config)
+    pool.register_florence(model_config.florence_model_name)
+    pool.register_florence(model_config.florence_base_model_name)
+    for name in pool_config.inpaint_models:
+        pool.register_iopaint(name)
+    return pool
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能剖析模式
+按流水线阶段和图像 ID 标记耗时：模型调用由 torch profiler 在按图像计数的采样窗口内记录，
+其余部分采样 Python 调用栈。输出 Chrome trace JSON、折叠栈（flamegraph.pl / speedscope 可直接读取）
+以及运行结束时的热点汇总
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import torch
+from loguru import logger
+
+from config import ProfileConfig
+
+# 当前生效的剖析器；为 None 时 stage() / image_scope() 不做任何事
+_active: Optional["Profiler"] = None
+
+
+@contextmanager
+def stage(name: str):
+    """标记一个流水线阶段（未开启剖析时为空操作）"""
+    profiler = _active
+    if profiler is None:
+        yield
+        return
+    with profiler.stage(name):
+        yield
+
+
+@contextmanager
+def image_scope(image_id: str):
+    """标记当前线程正在处理的图像（未开启剖析时为空操作）"""
+    profiler = _active
+    if profiler is None:
+        yield
+        return
+    with profiler.image(image_id):
+        yield
+
+
+def _collapse(frame) -> List[str]:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{Path(code.co_filename).stem}:{code.co_name}")
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+class Profiler:
+    """
+    阶段剖析器
+
+    with Profiler(config) 期间：
+    - stage() 记录每个阶段的起止时间（Chrome trace 的 "X" 事件，args 带 stage 和 image_id），
+      并在 torch profiler 中打上同名 record_function 标签
+    - 后台线程按 sample_interval_s 采样已登记线程的 Python 调用栈，栈底加上图像和阶段前缀
+    - torch profiler 按 schedule 运行，每处理完一张图像前进一步，只在采样窗口内记录算子，
+      模型加载落在开头的等待阶段；每个窗口结束时写出一份 torch trace
+    """
+
+    def __init__(self, profile_config: ProfileConfig):
+        self.config = profile_config
+        self.output_dir = Path(profile_config.output_dir)
+        self._contexts: Dict[int, Dict] = {}
+        self._events: List[Dict] = []
+        self._stage_totals: Dict[str, float] = defaultdict(float)
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._torch_profiler = None
+        self._torch_tables: List[str] = []
+        self._step_lock = threading.Lock()
+        self._origin_ns = time.perf_counter_ns()
+
+    def _context(self) -> Dict:
+        return self._contexts.setdefault(threading.get_ident(), {"image": None, "stages": []})
+
+    @contextmanager
+    def image(self, image_id: str):
+        context = self._context()
+        previous, context["image"] = context["image"], image_id
+        try:
+            yield
+        finally:
+            context["image"] = previous
+            if previous is None and self._torch_profiler is not None:
+                # One schedule step per image
+                with self._step_lock:
+                    self._torch_profiler.step()
+
+    @contextmanager
+    def stage(self, name: str):
+        context = self._context()
+        context["stages"].append(name)
+        label = f"{name}[{context['image']}]" if context["image"] else name
+        record = torch.profiler.record_function(label) if self._torch_profiler is not None else nullcontext()
+        start = time.perf_counter_ns()
+        try:
+            with record:
+                yield
+        finally:
+            duration = time.perf_counter_ns() - start
+            context["stages"].pop()
+            self._stage_totals[name] += duration / 1e9
+            self._events.append({
+                "name": name, "cat": "stage", "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                "ts": (start - self._origin_ns) / 1e3, "dur": duration / 1e3,
+                "args": {"stage": name, "image_id": context["image"]},
+            })
+
+    def _sample(self):
+        while not self._stop.wait(self.config.sample_interval_s):
+            frames = sys._current_frames()
+            for thread_id, context in list(self._contexts.items()):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                prefix = [f"image:{context['image'] or '-'}"] + [f"stage:{name}" for name in context["stages"]]
+                self._stacks[";".join(prefix + _collapse(frame))] += 1
+
+    def start(self):
+        global _active
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._context()  # always sample the thread that drives the pipeline
+        if self.config.torch_profiler:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            config = self.config
+            schedule = torch.profiler.schedule(wait=config.torch_wait, warmup=config.torch_warmup,
+                                               active=config.torch_active, repeat=config.torch_repeat)
+            self._torch_profiler = torch.profiler.profile(activities=activities, schedule=schedule,
+                                                          on_trace_ready=self._torch_trace_ready)
+            self._torch_profiler.__enter__()
+        self._sampler = threading.Thread(target=self._sample, name="stack-sampler", daemon=True)
+        self._sampler.start()
+        _active = self
+        logger.info(f"Profiling enabled, writing traces to {self.output_dir}")
+
+    def stop(self):
+        global _active
+        _active = None
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if self._torch_profiler is not None:
+            self._torch_profiler.__exit__(None, None, None)
+        self.export()
+        self.summarize()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _torch_trace_ready(self, profiler):
+        """一个采样窗口结束：写出 torch_trace_<n>.json 并保存算子热点表"""
+        window = len(self._torch_tables) + 1
+        profiler.export_chrome_trace(str(self.output_dir / f"torch_trace_{window}.json"))
+        table = profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=self.config.top_n)
+        self._torch_tables.append(f"Top torch ops (window {window}, up to image {profiler.step_num}):\n{table}")
+
+    def export(self):
+        """写出 trace.json 和 stacks.collapsed（torch trace 在每个采样窗口结束时写出）"""
+        with open(self.output_dir / "trace.json", "w") as f:
+            json.dump({"traceEvents": self._events, "displayTimeUnit": "ms"}, f)
+        with open(self.output_dir / "stacks.collapsed", "w") as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def summarize(self):
+        """输出阶段耗时、Python 自身热点和 torch 算子热点"""
+        top_n = self.config.top_n
+        lines = ["Stage wall time:"]
+        for name, seconds in sorted(self._stage_totals.items(), key=lambda item: -item[1]):
+            lines.append(f"  {name:<24} {seconds:9.3f}s")
+
+        leaves = Counter()
+        for stack, count in self._stacks.items():
+            frames = stack.split(";")
+            stage_frames = [f for f in frames if f.startswith("stage:")]
+            stage_name = stage_frames[-1][len("stage:"):] if stage_frames else "-"
+            leaves[(stage_name, frames[-1])] += count
+        total = sum(leaves.values()) or 1
+        lines.append(f"Top Python hotspots ({total} samples):")
+        for (stage_name, leaf), count in leaves.most_common(top_n):
+            lines.append(f"  {count / total:6.1%}  {leaf}  [{stage_name}]")
+
+        lines.extend(self._torch_tables)
+        if self._torch_profiler is not None and not self._torch_tables:
+            lines.append("No torch profiler window completed (too few images for the schedule)")
+        logger.info("Profile summary\n" + "\n".join(lines))
+
+
+def maybe_profile(profile_config: ProfileConfig):
+    """配置了 output_dir 时返回 Profiler，否则返回空上下文（供 CLI 和服务复用）"""
+    if not profile_config.output_dir:
+        return nullcontext()
+    return Profiler(profile_config)
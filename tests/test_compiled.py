@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+import pytest
+
+# config.py 导入时需要 torch 和 loguru
+pytest.importorskip("torch")
+pytest.importorskip("loguru")
+
+import torch
+
+from compiled import CompileStats, accepts_image_mask, bucket_for, compile_inpaint_model, compile_stats
+from config import CompileConfig
+
+BUCKETS = (256, 512, 768, 1024)
+
+
+@pytest.mark.parametrize("size,expected", [
+    ((100, 300), (256, 512)),
+    ((256, 256), (256, 256)),
+    ((257, 1024), (512, 1024)),
+    ((1, 1), (256, 256)),
+])
+def test_bucket_for_rounds_each_side_up(size, expected):
+    assert bucket_for(BUCKETS, *size) == expected
+
+
+@pytest.mark.parametrize("size", [(1025, 100), (100, 1025), (2000, 2000)])
+def test_bucket_for_returns_none_above_largest_bucket(size):
+    assert bucket_for(BUCKETS, *size) is None
+
+
+def test_compile_stats_reports_uncompiled_models():
+    stats = CompileStats()
+    stats.record("florence", "warmup", 2.0)
+    stats.record("florence", "hit")
+    stats.record("florence", "miss", 1.0)
+    stats.mark_uncompiled("lama", "TorchScript")
+
+    assert stats.hit_rate("florence") == 0.5
+    assert stats.hit_rate("lama") is None
+    summary = stats.summary()
+    assert "florence: hit rate 50.0%" in summary and "compile 3.0s" in summary
+    assert "lama: not compiled (TorchScript)" in summary
+
+
+class MatLikeGenerator(torch.nn.Module):
+    """与 iopaint MAT 生成器相同的调用方式：self.model(image, mask, z, label, truncation_psi=1, noise_mode="none")"""
+
+    def forward(self, images, masks, z, c, truncation_psi=1, noise_mode="none"):
+        return images
+
+
+class FcfLikeGenerator(torch.nn.Module):
+    """签名能以两个位置参数调用，但第二个参数是标签而不是掩膜"""
+
+    def forward(self, img, c, truncation_psi=1, noise_mode="const"):
+        raise ValueError("label must be a class embedding")
+
+
+class ImageMaskNetwork(torch.nn.Module):
+    def forward(self, image, mask):
+        return image
+
+
+def iopaint_manager(network):
+    return SimpleNamespace(model=SimpleNamespace(model=network))
+
+
+def test_accepts_image_mask_checks_forward_signature():
+    assert accepts_image_mask(ImageMaskNetwork())
+    assert not accepts_image_mask(MatLikeGenerator())
+
+
+def test_compile_inpaint_model_keeps_unsupported_signature_eager():
+    network = MatLikeGenerator()
+    manager = compile_inpaint_model(iopaint_manager(network), "mat", CompileConfig(enabled=True, backend="eager"))
+    assert manager.model.model is network
+    assert compile_stats.uncompiled["mat"] == "unsupported signature"
+    assert "mat: not compiled (unsupported signature)" in compile_stats.summary()
+
+
+def test_compile_inpaint_model_restores_network_when_warmup_fails():
+    network = FcfLikeGenerator()
+    config = CompileConfig(enabled=True, backend="eager", warmup_buckets=((256, 256),))
+    manager = compile_inpaint_model(iopaint_manager(network), "fcf", config)
+    assert manager.model.model is network
+    assert compile_stats.uncompiled["fcf"] == "warmup failed"
+    assert "fcf" not in compile_stats.counters
@@ -0,0 +1,72 @@
+import random
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# config.py 导入时需要 torch 和 loguru
+pytest.importorskip("torch")
+pytest.importorskip("loguru")
+
+from config import DedupConfig
+from dedup import ImageSignature, cluster_near_duplicates, cluster_signatures
+
+
+def pairwise_clusters(signatures, dedup_config):
+    """两两比较的参考实现"""
+    parent = list(range(len(signatures)))
+
+    def find(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    for i, a in enumerate(signatures):
+        for j in range(i + 1, len(signatures)):
+            b = signatures[j]
+            if a is None or b is None or abs(a.aspect - b.aspect) / a.aspect > dedup_config.aspect_tolerance:
+                continue
+            if bin(a.hash ^ b.hash).count("1") <= dedup_config.max_distance:
+                parent[find(j)] = find(i)
+    groups = {}
+    for i in range(len(signatures)):
+        groups.setdefault(find(i), []).append(i)
+    return sorted(sorted(members) for members in groups.values())
+
+
+@pytest.mark.parametrize("hash_size,max_distance,aspect_tolerance", [(8, 6, 0.02), (4, 3, 0.0), (16, 10, 0.3)])
+def test_cluster_signatures_matches_pairwise_comparison(hash_size, max_distance, aspect_tolerance):
+    rng = random.Random(hash_size)
+    bits = hash_size ** 2
+    bases = [rng.getrandbits(bits) for _ in range(20)]
+    signatures = []
+    for k in range(300):
+        value = rng.choice(bases)
+        for _ in range(rng.randint(0, max_distance + 3)):
+            value ^= 1 << rng.randrange(bits)
+        size = (rng.choice([400, 401, 404, 500]), 300)
+        signatures.append(None if k % 50 == 0 else ImageSignature(Path(f"{k}.png"), size, value))
+
+    dedup_config = DedupConfig(hash_size=hash_size, max_distance=max_distance, aspect_tolerance=aspect_tolerance)
+    clusters = cluster_signatures(signatures, dedup_config)
+    assert sorted(sorted(members) for members in clusters) == pairwise_clusters(signatures, dedup_config)
+    # Clusters keep first-seen order and lead with the largest member
+    assert [min(members) for members in clusters] == sorted(min(members) for members in clusters)
+    for members in clusters:
+        areas = [signatures[i].area if signatures[i] else 0 for i in members]
+        assert areas == sorted(areas, reverse=True)
+
+
+def test_cluster_near_duplicates_groups_rescaled_copies(tmp_path):
+    y, x = np.mgrid[0:300, 0:400]
+    original = np.stack([x * 255 // 400, y * 255 // 300, (x + y) % 256], axis=-1).astype(np.uint8)
+    Image.fromarray(original).save(tmp_path / "original.png")
+    Image.fromarray(original).resize((200, 150)).save(tmp_path / "small.png")
+    Image.fromarray(original[:, ::-1]).save(tmp_path / "mirrored.png")
+    Image.fromarray(original[:, :300]).save(tmp_path / "cropped.png")
+
+    paths = [tmp_path / name for name in ("small.png", "mirrored.png", "original.png", "cropped.png")]
+    clusters = cluster_near_duplicates(paths, DedupConfig())
+    assert clusters == [[tmp_path / "original.png", tmp_path / "small.png"], [tmp_path / "mirrored.png"],
+                        [tmp_path / "cropped.png"]]
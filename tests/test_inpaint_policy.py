@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+# config.py 导入时需要 torch 和 loguru
+pytest.importorskip("torch")
+pytest.importorskip("loguru")
+
+from config import InpaintPolicyConfig
+from inpaint_policy import route_regions, tiered_inpaint
+
+
+def flat_image(size=(200, 300)):
+    return np.full((*size, 3), 128, dtype=np.uint8)
+
+
+def test_route_regions_splits_small_thin_and_large_regions():
+    mask = np.zeros((200, 300), dtype=np.uint8)
+    mask[10:16, 10:60] = 255     # small thin stroke on a flat background -> OpenCV
+    mask[80:180, 100:250] = 255  # large block -> LaMa
+    reports, labels = route_regions(flat_image(), mask, InpaintPolicyConfig(enabled=True))
+
+    methods = {report.bbox: report.method for report in reports}
+    assert methods == {(10, 10, 50, 6): "opencv-telea", (100, 80, 150, 100): "lama"}
+    assert labels.shape == mask.shape
+    for report in reports:
+        x, y, w, h = report.bbox
+        assert (labels[y:y + h, x:x + w] == report.label).sum() == report.area
+
+
+def test_route_regions_sends_textured_background_to_lama():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (200, 300, 3), dtype=np.uint8)
+    mask = np.zeros((200, 300), dtype=np.uint8)
+    mask[10:16, 10:60] = 255
+    reports, _ = route_regions(image, mask, InpaintPolicyConfig(enabled=True))
+    assert [report.method for report in reports] == ["lama"]
+
+
+def test_tiered_inpaint_hands_only_lama_regions_to_lama():
+    mask = np.zeros((200, 300), dtype=np.uint8)
+    mask[10:16, 10:60] = 255
+    mask[80:180, 100:250] = 255
+    seen = {}
+
+    def lama_fn(image, lama_mask):
+        seen["mask"] = lama_mask.copy()
+        return image
+
+    _, reports = tiered_inpaint(flat_image(), mask, lama_fn, InpaintPolicyConfig(enabled=True))
+    assert len(reports) == 2
+    assert seen["mask"][100, 150] == 255 and seen["mask"][12, 20] == 0
+    assert seen["mask"].sum() // 255 == 100 * 150
+
+
+def test_route_regions_without_regions():
+    reports, labels = route_regions(flat_image(), np.zeros((200, 300), dtype=np.uint8), InpaintPolicyConfig())
+    assert reports == [] and not labels.any()
@@ -0,0 +1,79 @@
+import json
+
+import numpy as np
+import pytest
+
+# config.py 导入时需要 torch 和 loguru
+pytest.importorskip("torch")
+pytest.importorskip("loguru")
+
+from cascade import DetectionResult
+from image_buffer import bboxes_to_mask_array
+from manifest import ManifestRecord, ManifestWriter, read_manifest, rle_decode, rle_encode
+
+
+@pytest.mark.parametrize("mask", [
+    np.zeros((4, 5), dtype=np.uint8),
+    np.full((4, 5), 255, dtype=np.uint8),
+    bboxes_to_mask_array((40, 30), [(0, 0, 3, 3), (10, 5, 30, 12)]),
+    (np.random.default_rng(0).random((31, 17)) > 0.5).astype(np.uint8) * 255,
+])
+def test_rle_round_trip(mask):
+    rle = rle_encode(mask)
+    assert rle["size"] == list(mask.shape)
+    assert sum(rle["counts"]) == mask.size
+    decoded = rle_decode(rle)
+    assert decoded.dtype == np.uint8
+    np.testing.assert_array_equal(decoded, (mask > 0).astype(np.uint8) * 255)
+
+
+def test_rle_is_row_major_and_starts_with_background():
+    mask = np.array([[255, 255, 0], [0, 0, 255]], dtype=np.uint8)
+    assert rle_encode(mask)["counts"] == [0, 2, 3, 1]
+
+
+def detection(size=(40, 30)):
+    bboxes = [(10, 5, 30, 12)]
+    return DetectionResult(mask=bboxes_to_mask_array(size, bboxes), tier="base", accepted_bboxes=bboxes,
+                           rejected_bboxes=[(0, 0, 39, 29)], heuristic_score=0.25)
+
+
+def test_record_round_trip_keeps_integer_boxes():
+    record = ManifestRecord.from_detection("a.png", (40, 30), detection())
+    data = json.loads(record.to_json())
+    assert data["accepted_bboxes"] == [[10, 5, 30, 12]]
+    assert all(isinstance(v, int) for bbox in data["accepted_bboxes"] + data["rejected_bboxes"] for v in bbox)
+
+    restored = ManifestRecord.from_json(record.to_json()).to_detection()
+    assert restored.accepted_bboxes == [(10, 5, 30, 12)]
+    assert restored.rejected_bboxes == [(0, 0, 39, 29)]
+    assert restored.tier == "base" and restored.heuristic_score == 0.25
+    np.testing.assert_array_equal(restored.mask, detection().mask)
+
+
+def test_to_detection_rejects_mask_of_wrong_size():
+    record = ManifestRecord.from_detection("a.png", (40, 30), detection())
+    record.size = (30, 40)
+    with pytest.raises(ValueError, match="Mask of a.png"):
+        record.to_detection()
+
+
+def test_from_json_rejects_unknown_version():
+    line = ManifestRecord.from_detection("a.png", (40, 30), detection()).to_json()
+    with pytest.raises(ValueError, match="Unsupported manifest version"):
+        ManifestRecord.from_json(line.replace('"version":1', '"version":99'))
+
+
+def test_read_manifest_resolves_paths_relative_to_manifest(tmp_path, monkeypatch):
+    (tmp_path / "images").mkdir()
+    (tmp_path / "images" / "a.png").write_bytes(b"")
+    manifest_path = tmp_path / "manifest.jsonl"
+    with ManifestWriter(manifest_path) as writer:
+        writer.write(ManifestRecord.from_detection("images/a.png", (40, 30), detection()))
+        writer.write(ManifestRecord.from_detection("missing.png", (40, 30), detection()))
+    with open(manifest_path, "a") as f:
+        f.write("\n")
+
+    monkeypatch.chdir(tmp_path / "images")
+    records = list(read_manifest(manifest_path))
+    assert [record.input_path for record in records] == [str(tmp_path / "images" / "a.png"), "missing.png"]
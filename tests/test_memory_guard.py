@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+# memory_guard.py 导入时需要 torch 和 loguru
+torch = pytest.importorskip("torch")
+pytest.importorskip("loguru")
+
+import memory_guard
+from config import MemoryConfig
+from memory_guard import (MB, PLAN_DEFER, PLAN_NORMAL, PLAN_SMALL_CROPS, PLAN_TILED, MemoryWatchdog,
+                          crop_megapixels, is_out_of_memory, mask_boxes)
+
+IMAGE_SIZE = (4000, 3000)
+# 底部的水印条，裁剪后 (1000 + 128) x (200 + 128)
+BOXES = [(1000, 2700, 2000, 2900)]
+
+
+@pytest.fixture(autouse=True)
+def fixed_rss(monkeypatch):
+    monkeypatch.setattr(memory_guard, "current_rss", lambda: 1000 * MB)
+
+
+def test_mask_boxes_finds_each_region():
+    mask = np.zeros((100, 200), dtype=np.uint8)
+    mask[10:20, 30:80] = 255
+    mask[60:90, 150:160] = 255
+    assert sorted(mask_boxes(mask)) == [(30, 10, 80, 20), (150, 60, 160, 90)]
+    assert mask_boxes(np.zeros((10, 10), dtype=np.uint8)) == []
+
+
+def test_crop_megapixels_follows_iopaint_crop_strategy():
+    # No mask: nothing is inpainted
+    assert crop_megapixels(IMAGE_SIZE, [], 800, 64) == 0.0
+    # Long side within the trigger size: the whole image goes through LaMa
+    assert crop_megapixels((800, 600), [(0, 0, 10, 10)], 800, 64) == 800 * 600 / 1e6
+    # Larger images: only the largest box plus margins, clipped to the image
+    assert crop_megapixels(IMAGE_SIZE, BOXES + [(0, 0, 10, 10)], 800, 64) == 1128 * 328 / 1e6
+    assert crop_megapixels((1000, 900), [(0, 0, 990, 10)], 800, 64) == 1000 * 138 / 1e6
+
+
+def watchdog(ceiling_mb):
+    return MemoryWatchdog(MemoryConfig(ceiling_mb=ceiling_mb, decode_mb_per_mp=30, lama_mb_per_mp=180), "cpu")
+
+
+def test_plan_without_ceiling_is_normal():
+    assert watchdog(None).plan(IMAGE_SIZE, BOXES) == (PLAN_NORMAL, None)
+
+
+def test_plan_charges_crop_area_not_the_whole_image():
+    plan, predicted = watchdog(2000).plan(IMAGE_SIZE, BOXES)
+    assert plan == PLAN_NORMAL
+    assert predicted == pytest.approx(1000 + 12 * 30 + 1128 * 328 / 1e6 * 180)
+
+
+def test_plan_degrades_then_defers():
+    boxes = [(0, 0, 3000, 2000)]
+    decode_mb = 1000 + 12 * 30
+    small_crops_mb = decode_mb + 3064 * 2064 / 1e6 * 180
+    tiled_mb = decode_mb + 640 * 640 / 1e6 * 180
+    # Normal crops (3128 x 2128) do not fit, the smaller margin does
+    assert watchdog(small_crops_mb + 1).plan(IMAGE_SIZE, boxes)[0] == PLAN_SMALL_CROPS
+    assert watchdog(tiled_mb + 1).plan(IMAGE_SIZE, boxes)[0] == PLAN_TILED
+    plan, predicted = watchdog(tiled_mb - 1).plan(IMAGE_SIZE, boxes)
+    assert plan == PLAN_DEFER and predicted == pytest.approx(tiled_mb)
+
+
+def test_plan_before_detection_only_counts_decoding():
+    assert watchdog(1000 + 12 * 30 + 1).plan(IMAGE_SIZE) == (PLAN_NORMAL, pytest.approx(1360))
+    assert watchdog(1000).plan(IMAGE_SIZE)[0] == PLAN_DEFER
+
+
+@pytest.mark.parametrize("error,expected", [
+    (MemoryError(), True),
+    (RuntimeError("[enforce fail at alloc_cpu.cpp:114] . DefaultCPUAllocator: can't allocate memory: "
+                  "you tried to allocate 123 bytes."), True),
+    (RuntimeError("DefaultCPUAllocator: not enough memory: you tried to allocate 123 bytes."), True),
+    (torch.cuda.OutOfMemoryError("CUDA out of memory. Tried to allocate 2.00 GiB"), True),
+    (RuntimeError("The size of tensor a (3) must match the size of tensor b (4)"), False),
+    (ValueError("out of memory"), False),
+])
+def test_is_out_of_memory(error, expected):
+    assert is_out_of_memory(error) is expected
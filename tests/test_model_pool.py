@@ -0,0 +1,112 @@
+from types import SimpleNamespace
+
+import pytest
+
+# model_pool.py 导入时需要 torch、loguru 和 transformers
+pytest.importorskip("torch")
+pytest.importorskip("loguru")
+pytest.importorskip("transformers")
+
+import model_pool
+from config import PoolConfig
+from model_pool import MB, ModelPool
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(model_pool.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture(autouse=True)
+def fake_sizes(monkeypatch):
+    # Fake models report their size directly instead of through torch tensors
+    monkeypatch.setattr(model_pool, "tensor_nbytes", lambda value: value.nbytes)
+
+
+def make_pool(sizes_mb, budget_mb=None, idle_timeout_s=None):
+    pool = ModelPool("cpu", PoolConfig(memory_budget_mb=budget_mb, idle_timeout_s=idle_timeout_s))
+    pool.loads = []
+    pool.resident_at_load = []
+
+    def loader(name):
+        def load():
+            pool.loads.append(name)
+            pool.resident_at_load.append(pool.resident_bytes)
+            return SimpleNamespace(name=name, nbytes=int(sizes_mb[name] * MB))
+        return load
+
+    for name in sizes_mb:
+        pool.register(name, loader(name))
+    return pool
+
+
+def loaded(pool):
+    return [name for name in ("a", "b", "c") if pool.is_loaded(name)]
+
+
+def test_budget_evicts_least_recently_used(clock):
+    pool = make_pool({"a": 2, "b": 2, "c": 2}, budget_mb=4)
+    pool.get("a")
+    pool.get("b")
+    pool.get("a")  # b is now the least recently used
+    pool.get("c")
+    assert loaded(pool) == ["a", "c"]
+
+
+def test_reload_evicts_before_loading_when_size_is_known(clock):
+    pool = make_pool({"a": 4, "b": 4}, budget_mb=5)
+    for name in ("a", "b", "a", "b"):
+        pool.get(name)
+    assert pool.loads == ["a", "b", "a", "b"]
+    # The first load of b cannot know its size; every reload finds the other model already unloaded
+    assert pool.resident_at_load == [0, 4 * MB, 0, 0]
+
+
+def test_pinned_and_leased_models_survive_budget(clock):
+    pool = make_pool({"a": 2, "b": 2, "c": 2}, budget_mb=4)
+    with pool.lease("a") as model:
+        assert model.name == "a"
+        with pool.pin("b"):
+            pool.get("b")
+            pool.get("c")
+            assert loaded(pool) == ["a", "b", "c"]
+    pool.get("c")
+    assert loaded(pool) == ["b", "c"]
+
+
+def test_idle_timeout_skips_models_in_use(clock):
+    pool = make_pool({"a": 1, "b": 1}, idle_timeout_s=60)
+    pool.get("a")
+    pool.get("b")
+    with pool.pin("a"):
+        clock.now += 61
+        pool.evict_idle()
+        assert loaded(pool) == ["a"]
+    # Releasing the pin counts as a use, so a is only idle again after another timeout
+    clock.now += 30
+    pool.evict_idle()
+    assert loaded(pool) == ["a"]
+    clock.now += 31
+    pool.evict_idle()
+    assert loaded(pool) == []
+
+
+def test_pin_counts_nested_uses(clock):
+    pool = make_pool({"a": 1}, idle_timeout_s=10)
+    pool.get("a")
+    with pool.pin("a"):
+        with pool.pin("a"):
+            pass
+        clock.now += 11
+        pool.evict_idle()
+        assert loaded(pool) == ["a"]
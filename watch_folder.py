@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+监控目录守护模式
+模型常驻内存，监控一个或多个输入目录（Linux 下使用 inotify，否则轮询），
+按批处理写入完成的文件，并把输入移动到 done / failed 目录
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from loguru import logger
+
+from config import WatchConfig
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tiff"}
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    """最小化的 inotify 封装（ctypes 调用 libc，无额外依赖）"""
+
+    def __init__(self, directories: Sequence[Path]):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: Dict[int, Path] = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+            self.watches[wd] = directory
+
+    def read(self, timeout: float) -> List[Path]:
+        """等待最多 timeout 秒，返回写入完成或移入的文件路径"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        paths, offset = [], 0
+        while offset < len(data):
+            wd, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name and wd in self.watches:
+                paths.append(self.watches[wd] / os.fsdecode(name))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """
+    监控输入目录，返回已写入完成的图像文件
+
+    inotify 的 IN_CLOSE_WRITE / IN_MOVED_TO 事件表示文件已完成；
+    同时每轮重新扫描目录，大小和修改时间在 settle_s 内保持不变的文件也视为完成
+    （覆盖启动前已存在的文件、丢失的事件以及不支持 inotify 的平台）。
+    """
+
+    def __init__(self, directories: Sequence[Path], watch_config: WatchConfig):
+        self.directories = [Path(d) for d in directories]
+        self.config = watch_config
+        self._pending: Dict[Path, Tuple[int, float]] = {}
+        # 已交出处理的文件签名，避免未能移走的文件被重复处理
+        self._handled: Dict[Path, Tuple[int, float]] = {}
+        self._inotify = None
+        if watch_config.use_inotify and sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify(self.directories)
+            except OSError as e:
+                logger.warning(f"inotify unavailable ({e}), falling back to polling")
+        mode = "inotify" if self._inotify else "polling"
+        logger.info(f"Watching {', '.join(map(str, self.directories))} ({mode})")
+
+    @staticmethod
+    def _is_candidate(path: Path) -> bool:
+        return path.suffix.lower() in IMAGE_SUFFIXES and not path.name.startswith(".") and path.is_file()
+
+    @staticmethod
+    def _signature(path: Path) -> Tuple[int, float]:
+        stat = path.stat()
+        return stat.st_size, stat.st_mtime
+
+    def _scan(self) -> List[Path]:
+        now = time.time()
+        ready = []
+        current = set()
+        for directory in self.directories:
+            for path in directory.iterdir():
+                if not self._is_candidate(path):
+                    continue
+                try:
+                    signature = self._signature(path)
+                except FileNotFoundError:
+                    # Removed between listing and stat, e.g. moved away by another consumer
+                    continue
+                current.add(path)
+                if self._handled.get(path) == signature:
+                    continue
+                if self._pending.get(path) == signature and now - signature[1] >= self.config.settle_s:
+                    ready.append(path)
+                else:
+                    self._pending[path] = signature
+        for tracked in (self._pending, self._handled):
+            for path in list(tracked):
+                if path not in current:
+                    del tracked[path]
+        return ready
+
+    def poll(self) -> List[Path]:
+        """等待一个轮询周期，返回本轮就绪的文件（按发现顺序去重）"""
+        if self._inotify is not None:
+            events = [path for path in self._inotify.read(self.config.poll_interval_s) if self._is_candidate(path)]
+        else:
+            time.sleep(self.config.poll_interval_s)
+            events = []
+        ready = []
+        for path in dict.fromkeys(events + self._scan()):
+            try:
+                signature = self._signature(path)
+            except FileNotFoundError:
+                continue
+            if self._handled.get(path) == signature:
+                continue
+            self._pending.pop(path, None)
+            self._handled[path] = signature
+            ready.append(path)
+        return ready
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+
+
+def output_dirs(directories: Sequence[Path], output_path: Path) -> Dict[Path, Path]:
+    """
+    每个监控目录的输出目录
+
+    只监控一个目录时直接输出到 output_path；多个目录时按目录名分到子目录（重名时追加序号），
+    避免不同目录中的同名上传互相覆盖
+    """
+    directories = [Path(d) for d in directories]
+    if len(directories) == 1:
+        return {directories[0]: output_path}
+    targets, used = {}, set()
+    for directory in directories:
+        name, index = directory.resolve().name or "root", 1
+        while name in used:
+            index += 1
+            name = f"{directory.resolve().name or 'root'}-{index}"
+        used.add(name)
+        targets[directory] = output_path / name
+    return targets
+
+
+def move_to(path: Path, folder_name: str) -> Path:
+    """把输入文件移动到同级的 done / failed 目录，重名时追加时间戳"""
+    target_dir = path.parent / folder_name
+    target_dir.mkdir(exist_ok=True)
+    target = target_dir / path.name
+    if target.exists():
+        target = target_dir / f"{path.stem}.{int(time.time() * 1000)}{path.suffix}"
+    path.replace(target)
+    return target
+
+
+def serve(directories: Sequence[Path], process_batch: Callable[[List[Path]], Dict[Path, bool]],
+          watch_config: WatchConfig):
+    """
+    守护循环：收集就绪文件，按 batch_size 分批交给 process_batch，
+    根据返回的成功标志把输入移动到 done 或 failed 目录。收到 SIGINT / SIGTERM 后处理完当前批次退出。
+    """
+    stop = threading.Event()
+
+    def _request_stop(signum, _frame):
+        logger.info(f"Received signal {signum}, stopping after the current batch")
+        stop.set()
+
+    signal.signal(signal.SIGINT, _request_stop)
+    signal.signal(signal.SIGTERM, _request_stop)
+
+    watcher = FolderWatcher(directories, watch_config)
+    try:
+        while not stop.is_set():
+            ready = watcher.poll()
+            for start in range(0, len(ready), watch_config.batch_size):
+                if stop.is_set():
+                    break
+                batch = ready[start:start + watch_config.batch_size]
+                outcomes = process_batch(batch)
+                for path in batch:
+                    if not path.exists():
+                        continue
+                    ok = outcomes.get(path, False)
+                    target = move_to(path, watch_config.done_dir if ok else watch_config.failed_dir)
+                    logger.info(f"{'Done' if ok else 'Failed'}: {path} -> {target}")
+    finally:
+        watcher.close()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+可嵌入的水印去除库
+main.py 和 cli_tool.py 共用的检测 + 修复流水线；模型只加载一次，
+接受 PIL 图像、NumPy 数组或编码后的字节，在内存中返回掩膜和结果，不读写磁盘
+"""
+
+import io
+from dataclasses import dataclass, field, replace
+from enum import Enum
+from pathlib import Path
+from typing import Iterable, List, Optional, Union
+
+import numpy as np
+import torch
+from PIL import Image
+from iopaint.model_manager import ModelManager
+from iopaint.schema import HDStrategy, LDMSampler, InpaintRequest as Config
+from loguru import logger
+from transformers import AutoProcessor, AutoModelForCausalLM
+
+from cascade import DetectionResult, build_detector, split_bboxes, bboxes_to_mask
+from config import ConfigManager, config as default_config
+from image_buffer import ImageBuffer, make_transparent, writable_array
+from inpaint_policy import RegionReport, tiered_inpaint
+from memory_guard import PLAN_NORMAL, PLAN_SMALL_CROPS, PLAN_TILED
+from model_pool import ModelPool, create_model_pool
+from profiling import stage
+
+try:
+    from cv2.typing import MatLike
+except ImportError:
+    MatLike = np.ndarray
+
+ImageInput = Union[Image.Image, np.ndarray, bytes, bytearray]
+# 可选的输出格式（JPG 保存时映射为 PIL 的 JPEG）
+OUTPUT_FORMATS = ("PNG", "WEBP", "JPG")
+
+
+class TaskType(str, Enum):
+    OPEN_VOCAB_DETECTION = "<OPEN_VOCABULARY_DETECTION>"
+    """Detect bounding box for objects and OCR text"""
+
+
+@torch.inference_mode()
+def identify(task_prompt: TaskType, image: MatLike, text_input: str, model: AutoModelForCausalLM,
+             processor: AutoProcessor, device: str):
+    if not isinstance(task_prompt, TaskType):
+        raise ValueError(f"task_prompt must be a TaskType, but {task_prompt} is of type {type(task_prompt)}")
+
+    prompt = task_prompt.value if text_input is None else task_prompt.value + text_input
+    with stage("detect.preprocess"):
+        inputs = processor(text=prompt, images=image, return_tensors="pt")
+        inputs = {k: v.to(device) for k, v in inputs.items()}
+
+    with stage("detect.generate"):
+        generated_ids = model.generate(
+            input_ids=inputs["input_ids"],
+            pixel_values=inputs["pixel_values"],
+            max_new_tokens=1024,
+            early_stopping=False,
+            do_sample=False,
+            num_beams=3,
+        )
+    with stage("detect.postprocess"):
+        generated_text = processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
+        return processor.post_process_generation(
+            generated_text, task=task_prompt.value, image_size=(image.width, image.height)
+        )
+
+
+def get_watermark_mask(image: MatLike, model: AutoModelForCausalLM, processor: AutoProcessor, device: str,
+                       max_bbox_percent: float):
+    text_input = "watermark"
+    task_prompt = TaskType.OPEN_VOCAB_DETECTION
+    parsed_answer = identify(task_prompt, image, text_input, model, processor, device)
+    accepted, _ = split_bboxes(parsed_answer, image.size, max_bbox_percent)
+    return bboxes_to_mask(image.size, accepted)
+
+
+@torch.inference_mode()
+def process_image_with_lama(image: MatLike, mask: MatLike, model_manager: ModelManager, crop_margin: int = 64,
+                            crop_trigger_size: int = 800):
+    config = Config(
+        ldm_steps=50,
+        ldm_sampler=LDMSampler.ddim,
+        hd_strategy=HDStrategy.CROP,
+        hd_strategy_crop_margin=crop_margin,
+        hd_strategy_crop_trigger_size=crop_trigger_size,
+        hd_strategy_resize_limit=1600,
+    )
+    # iopaint's crop strategy writes into the input, so only copy read-only buffers
+    image = writable_array(image)
+    with stage("inpaint.lama"):
+        result = model_manager(image, mask, config)
+
+    if result.dtype in [np.float64, np.float32]:
+        result = np.clip(result, 0, 255).astype(np.uint8)
+
+    return result
+
+
+def process_image_tiled(image: MatLike, mask: MatLike, model_manager: ModelManager, tile_size: int = 512,
+                        margin: int = 64):
+    # Inpaint one tile (plus context margin) at a time so memory is bounded by the tile, not the image
+    result = np.array(image, dtype=np.uint8)
+    height, width = mask.shape
+    for y in range(0, height, tile_size):
+        for x in range(0, width, tile_size):
+            inner = mask[y:y + tile_size, x:x + tile_size]
+            if not inner.any():
+                continue
+            x1, y1 = max(0, x - margin), max(0, y - margin)
+            x2, y2 = min(width, x + tile_size + margin), min(height, y + tile_size + margin)
+            tile_mask = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+            tile_mask[y - y1:y - y1 + inner.shape[0], x - x1:x - x1 + inner.shape[1]] = inner
+            tile = process_image_with_lama(result[y1:y2, x1:x2].copy(), tile_mask, model_manager,
+                                           crop_trigger_size=tile_size + 2 * margin)
+            result[y1:y2, x1:x2] = tile[..., ::-1]
+    return result[..., ::-1]
+
+
+def make_region_transparent(image: Image.Image, mask: Image.Image):
+    buffer = ImageBuffer.from_pil(image.convert("RGB"))
+    return make_transparent(buffer, np.asarray(mask.convert("L"))).to_pil()
+
+
+def to_pil_rgb(image: ImageInput) -> Image.Image:
+    """把 PIL 图像、NumPy 数组（RGB / RGBA / 灰度）或编码后的字节统一为 RGB PIL 图像"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = Image.open(io.BytesIO(image))
+    elif isinstance(image, np.ndarray):
+        image = Image.fromarray(image if image.dtype == np.uint8 else np.clip(image, 0, 255).astype(np.uint8))
+    elif not isinstance(image, Image.Image):
+        raise TypeError(f"Unsupported image input type: {type(image)}")
+    return image if image.mode == "RGB" else image.convert("RGB")
+
+
+def choose_output_format(input_path: Union[str, Path], transparent: bool = False,
+                         force_format: Optional[str] = None) -> str:
+    """
+    选择结果的保存格式，返回 PIL 格式名
+
+    强制格式优先，透明模式默认 PNG，否则沿用输入格式（不支持的格式改用 PNG）；透明结果不能保存为 JPEG，改用 PNG
+    """
+    if force_format:
+        output_format = force_format.upper()
+    elif transparent:
+        output_format = "PNG"
+    else:
+        output_format = Path(input_path).suffix[1:].upper()
+        if output_format not in OUTPUT_FORMATS:
+            output_format = "PNG"
+
+    # Map JPG to JPEG for PIL compatibility
+    if output_format == "JPG":
+        output_format = "JPEG"
+
+    if transparent and output_format == "JPEG":
+        logger.warning("Transparency detected. Defaulting to PNG for transparency support.")
+        output_format = "PNG"
+    return output_format
+
+
+def save_output(image: Image.Image, input_path: Union[str, Path], output_path: Union[str, Path],
+                transparent: bool = False, force_format: Optional[str] = None) -> Path:
+    """按 choose_output_format() 选择的格式保存结果，后缀随格式调整，返回实际写入的路径"""
+    output_format = choose_output_format(input_path, transparent, force_format)
+    output_path = Path(output_path).with_suffix(f".{output_format.lower()}")
+    with stage("encode"):
+        image.save(output_path, format=output_format)
+    return output_path
+
+
+@dataclass
+class RemovalResult:
+    """
+    单张图像的去除结果（全部在内存中）
+
+    直接修复（非分级、非透明）时 source 与 LaMa 共用同一块可写缓冲区，省去一次整图拷贝；
+    iopaint 的裁剪策略会就地写回，因此 source 的掩膜内像素可能已是修复结果，掩膜外与原图一致。
+    """
+    source: ImageBuffer
+    mask: np.ndarray
+    result: ImageBuffer
+    detection: DetectionResult
+    regions: List[RegionReport] = field(default_factory=list)
+
+    @property
+    def has_watermark(self) -> bool:
+        return bool(self.mask.any())
+
+    @property
+    def image(self) -> Image.Image:
+        return self.result.to_pil()
+
+    def encode(self, format: str = "PNG", **save_kwargs) -> bytes:
+        """编码结果图像为字节"""
+        output = io.BytesIO()
+        self.image.save(output, format=format, **save_kwargs)
+        return output.getvalue()
+
+
+class WatermarkRemover:
+    """
+    水印去除流水线
+
+    构造时加载检测模型（及非透明模式下的修复模型），之后可反复调用：
+
+        remover = WatermarkRemover()
+        result = remover.remove(open("a.jpg", "rb").read())
+        png_bytes = result.encode("PNG")
+
+    只跑检测或只跑修复时，用 preload_detector / preload_inpainter 跳过对应模型的预加载
+    （未预加载的模型在首次使用时仍会加载）。
+    """
+
+    def __init__(self, device: Optional[str] = None, cascade: bool = False, inpaint_model: str = "lama",
+                 max_bbox_percent: float = 10.0, tiered_inpaint: bool = False, transparent: bool = False,
+                 config_manager: ConfigManager = default_config, pool: Optional[ModelPool] = None,
+                 compiled: bool = False, preload_detector: bool = True, preload_inpainter: bool = True):
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.config = config_manager
+        self.inpaint_model = inpaint_model
+        self.max_bbox_percent = max_bbox_percent
+        self.tiered = tiered_inpaint or config_manager.inpaint_policy_config.enabled
+        self.transparent = transparent
+
+        compile_config = replace(config_manager.compile_config,
+                                 enabled=compiled or config_manager.compile_config.enabled)
+        self.pool = pool or create_model_pool(self.device, config_manager.model_config, config_manager.pool_config,
+                                              compile_config)
+        self.pool.register_iopaint(inpaint_model)
+        self.detector = build_detector(cascade or config_manager.cascade_config.enabled, config_manager.model_config,
+                                       config_manager.cascade_config, identify, self.device,
+                                       loader=lambda name, _: self.pool.get(name), pin=self.pool.pin)
+        if preload_detector:
+            self.detector.warmup()
+            logger.info("Florence-2 Model loaded")
+
+        # Tiered inpainting loads the inpainter lazily, only once a region actually needs it
+        if preload_inpainter and not transparent and not self.tiered:
+            self.pool.get(inpaint_model)
+            logger.info(f"{inpaint_model} model loaded")
+
+    def detect(self, image: ImageInput, max_bbox_percent: Optional[float] = None) -> DetectionResult:
+        """只检测水印，返回检测框和掩膜"""
+        image = to_pil_rgb(image)
+        max_bbox_percent = self.max_bbox_percent if max_bbox_percent is None else max_bbox_percent
+        return self.detector.detect(image, "watermark", TaskType.OPEN_VOCAB_DETECTION, max_bbox_percent)
+
+    def inpaint(self, image: np.ndarray, mask: np.ndarray, plan: str = PLAN_NORMAL) -> ImageBuffer:
+        """按内存计划用修复模型修复 RGB 数组中的掩膜区域"""
+        memory_config = self.config.memory_config
+        # Lease the model so idle eviction cannot drop it between tiles
+        with self.pool.lease(self.inpaint_model) as model_manager:
+            if plan == PLAN_TILED:
+                result = process_image_tiled(image, mask, model_manager, memory_config.tile_size,
+                                             memory_config.tile_margin)
+            elif plan == PLAN_SMALL_CROPS:
+                result = process_image_with_lama(image, mask, model_manager,
+                                                 crop_margin=memory_config.small_crop_margin,
+                                                 crop_trigger_size=memory_config.small_crop_trigger_size)
+            else:
+                result = process_image_with_lama(image, mask, model_manager, crop_margin=memory_config.crop_margin,
+                                                 crop_trigger_size=memory_config.crop_trigger_size)
+        return ImageBuffer(result, "BGR")
+
+    def remove(self, image: ImageInput, transparent: Optional[bool] = None, plan: str = PLAN_NORMAL,
+               max_bbox_percent: Optional[float] = None) -> RemovalResult:
+        """检测并去除（或透明化）水印"""
+        with stage("decode"):
+            image = to_pil_rgb(image)
+        detection = self.detect(image, max_bbox_percent)
+        return self.apply(image, detection, transparent=transparent, plan=plan)
+
+    def apply(self, image: ImageInput, detection: DetectionResult, transparent: Optional[bool] = None,
+              plan: str = PLAN_NORMAL) -> RemovalResult:
+        """按已有的检测结果（如从检测清单读取）去除或透明化水印，不再运行检测"""
+        transparent = self.transparent if transparent is None else transparent
+        with stage("decode"):
+            source = ImageBuffer.from_pil(to_pil_rgb(image))
+        mask = detection.mask
+        regions = []
+
+        if transparent:
+            with stage("transparent"):
+                result = make_transparent(source, mask)
+        elif not mask.any():
+            result = source
+        elif self.tiered:
+            def lama_rgb(image_array: np.ndarray, mask_array: np.ndarray) -> np.ndarray:
+                # LaMa returns BGR; hand back an RGB view instead of converting
+                return self.inpaint(image_array, mask_array, plan).rgb()
+
+            with stage("inpaint.tiered"):
+                result_array, regions = tiered_inpaint(source.array, mask, lama_rgb,
+                                                       self.config.inpaint_policy_config)
+            result = ImageBuffer(result_array, "RGB")
+        else:
+            result = self.inpaint(source.array, mask, plan)
+
+        return RemovalResult(source=source, mask=mask, result=result, detection=detection, regions=regions)
+
+    def remove_batch(self, images: Iterable[ImageInput], **kwargs) -> List[RemovalResult]:
+        """依次处理多张图像，参数同 remove()"""
+        return [self.remove(image, **kwargs) for image in images]
+
+    def close(self):
+        """卸载所有模型"""
+        self.pool.close()
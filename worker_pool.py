@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享权重的多进程工作池
+父进程加载一次全部模型并冻结 GC 追踪的对象，然后 fork 出工作进程。
+权重页以写时复制方式继承：推理只读不写，gc.freeze 又避免垃圾回收改写对象头，
+因此各工作进程共享同一份物理页，每个进程新增的只有自身的私有内存（激活、缓冲区等）。
+不使用 share_memory_()：那会把权重复制到 /dev/shm（容器默认只有 64 MB），并为每个存储占用一个文件描述符
+"""
+
+import gc
+import multiprocessing as mp
+import os
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import torch
+from loguru import logger
+
+from config import available_cpus
+from model_pool import MB, tensor_nbytes
+
+# fork 前设置，工作进程通过继承的内存直接拿到任务函数（闭包无需可序列化）
+_task: Optional[Callable[[Any], Any]] = None
+
+
+def memory_breakdown() -> Dict[str, float]:
+    """
+    当前进程的内存构成（MB），读取 /proc/self/smaps_rollup
+
+    private 为只属于本进程的页（即该工作进程的增量内存），shared 为与其他进程共享的页，
+    pss 按共享进程数分摊共享页。非 Linux 平台返回空字典。
+    """
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except OSError:
+        return {}
+    return {
+        "rss_mb": round(fields.get("Rss", 0) / MB, 1),
+        "pss_mb": round(fields.get("Pss", 0) / MB, 1),
+        "private_mb": round((fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)) / MB, 1),
+        "shared_mb": round((fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)) / MB, 1),
+    }
+
+
+def shared_model_names(remover) -> List[str]:
+    """remover 可能用到的全部模型：各级检测器及（非透明模式下的）修复模型"""
+    names = [tier.model_name for tier in remover.detector.tiers]
+    if not remover.transparent:
+        names.append(remover.inpaint_model)
+    return names
+
+
+def preload_shared(remover, names: List[str]) -> int:
+    """
+    加载 names 中的模型并冻结 GC 追踪的对象，返回模型张量字节数
+
+    调用方应在工作进程存续期间 pin 住这些模型：预加载时内存预算不会淘汰先加载的模型，
+    工作进程继承 pin 状态，也不会各自卸载后重新加载（那会把共享页换成私有副本）
+    """
+    pool = remover.pool
+    total = sum(tensor_nbytes(pool.get(name)) for name in names)
+    budget = pool.budget_bytes
+    if budget is not None and total > budget:
+        logger.warning(f"Shared models need {total / MB:.0f} MB, above the {budget / MB:.0f} MB pool budget; "
+                       f"the budget is not enforced for them while workers run")
+    # Move everything loaded so far out of the collector's reach, so its passes do not write to inherited pages
+    gc.collect()
+    gc.freeze()
+    return total
+
+
+def _init_worker(threads: int):
+    torch.set_num_threads(threads)
+
+
+def _run(item: Any):
+    return _task(item), os.getpid(), memory_breakdown()
+
+
+class SharedWorkerPool:
+    """
+    fork 工作进程池
+
+    创建时预加载并 pin 住全部模型（内存预算和空闲回收在工作进程存续期间不会卸载它们），
+    然后 fork workers 个进程；map() 把任务分发给工作进程，
+    按输入顺序返回 task(item) 的结果。关闭时输出每个工作进程的私有（增量）内存和共享内存。
+    仅支持 CPU：CUDA 上下文不能跨 fork 使用。
+    """
+
+    def __init__(self, remover, workers: int, task: Callable[[Any], Any], threads_per_worker: Optional[int] = None):
+        global _task
+        if remover.device != "cpu":
+            raise RuntimeError("Shared-weight workers need the CPU device; CUDA contexts do not survive fork")
+        self._pins = ExitStack()
+        names = shared_model_names(remover)
+        self._pins.enter_context(remover.pool.pin(*names))
+        try:
+            shared = preload_shared(remover, names)
+        except BaseException:
+            self._pins.close()
+            raise
+        self.parent_memory = memory_breakdown()
+        logger.info(f"Sharing {shared / MB:.0f} MB of weights with {workers} workers, "
+                    f"parent {self.parent_memory}")
+
+        _task = task
+        threads = threads_per_worker or max(1, available_cpus() // workers)
+        self._pool = mp.get_context("fork").Pool(workers, initializer=_init_worker, initargs=(threads,))
+        self.worker_memory: Dict[int, Dict[str, float]] = {}
+
+    def map(self, items: Iterable[Any]) -> Iterator[Any]:
+        for result, pid, memory in self._pool.imap(_run, items):
+            self.worker_memory[pid] = memory
+            yield result
+
+    def report(self) -> str:
+        """每个工作进程最近一次任务后的内存构成"""
+        lines = [f"parent: {self.parent_memory}"]
+        for pid, memory in sorted(self.worker_memory.items()):
+            lines.append(f"worker {pid}: incremental (private) {memory.get('private_mb')} MB, "
+                         f"shared {memory.get('shared_mb')} MB, rss {memory.get('rss_mb')} MB")
+        return "\n".join(lines)
+
+    def close(self, terminate: bool = False):
+        global _task
+        if terminate:
+            self._pool.terminate()
+        else:
+            self._pool.close()
+        self._pool.join()
+        _task = None
+        gc.unfreeze()
+        self._pins.close()
+        logger.info("Worker memory\n" + self.report())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(terminate=exc_type is not None)